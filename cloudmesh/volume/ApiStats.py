@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from time import monotonic
+
+from cloudmesh.common.util import path_expand
+
+
+class ApiStats(object):
+    """
+    Statistics of the API calls made through botocore clients.
+
+    ApiStats.register(client) adds handlers to the event system of a boto3
+    client. For every API call the service, the operation, the latency, the
+    number of retries, whether it was throttled and whether it failed are
+    recorded in ApiStats.calls. ApiStats.stats() aggregates them per
+    operation and ApiStats.export() writes them as json.
+
+    Usage::
+
+        client = boto3.client('ec2')
+        ApiStats.register(client)
+        ...
+        print(ApiStats.stats())
+    """
+
+    throttling = [
+        'Throttling',
+        'ThrottlingException',
+        'ThrottledException',
+        'RequestThrottled',
+        'RequestThrottledException',
+        'RequestLimitExceeded',
+        'TooManyRequestsException',
+        'SlowDown',
+    ]
+
+    calls = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, client):
+        """
+        Record the API calls of a botocore client
+
+        :param client: boto3 or botocore client
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        events = client.meta.events
+        events.register(f"before-call.{service}", cls._before,
+                        unique_id=f"api-stats-before-{service}")
+        events.register(f"needs-retry.{service}", cls._retry,
+                        unique_id=f"api-stats-retry-{service}")
+        events.register(f"after-call.{service}", cls._after,
+                        unique_id=f"api-stats-after-{service}")
+
+    @staticmethod
+    def _error(parsed):
+        if not isinstance(parsed, dict):
+            return None
+        return parsed.get('Error', {}).get('Code')
+
+    @classmethod
+    def _before(cls, context=None, **kwargs):
+        if context is not None:
+            context['api_stats'] = {'start': monotonic(), 'throttled': 0}
+
+    @classmethod
+    def _retry(cls, response=None, request_dict=None, **kwargs):
+        # called after every attempt, counts the throttled attempts
+        if response is None or request_dict is None:
+            return None
+        stats = request_dict.get('context', {}).get('api_stats')
+        if stats is not None and cls._error(response[1]) in cls.throttling:
+            stats['throttled'] += 1
+        return None
+
+    @classmethod
+    def _after(cls, model=None, parsed=None, context=None, **kwargs):
+        stats = (context or {}).get('api_stats')
+        if stats is None:
+            return
+        metadata = parsed.get('ResponseMetadata', {}) \
+            if isinstance(parsed, dict) else {}
+        error = cls._error(parsed)
+        with cls._lock:
+            cls.calls.append({
+                "service": model.service_model.service_name,
+                "operation": model.name,
+                "latency": round(monotonic() - stats['start'], 4),
+                "retries": metadata.get('RetryAttempts', 0),
+                "throttled": stats['throttled'],
+                "error": error
+            })
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget the recorded calls
+        """
+        with cls._lock:
+            cls.calls = []
+
+    @classmethod
+    def stats(cls):
+        """
+        Aggregate the recorded calls per service and operation
+
+        :return: list of dict with service, operation, calls, errors,
+                 retries, throttled, latency and max_latency in seconds
+        """
+        result = {}
+        with cls._lock:
+            calls = list(cls.calls)
+        for call in calls:
+            key = (call["service"], call["operation"])
+            if key not in result:
+                result[key] = {"service": call["service"],
+                               "operation": call["operation"],
+                               "calls": 0,
+                               "errors": 0,
+                               "retries": 0,
+                               "throttled": 0,
+                               "latency": 0.0,
+                               "max_latency": 0.0}
+            entry = result[key]
+            entry["calls"] += 1
+            entry["errors"] += int(call["error"] is not None)
+            entry["retries"] += call["retries"]
+            entry["throttled"] += call["throttled"]
+            entry["latency"] = round(entry["latency"] + call["latency"], 4)
+            entry["max_latency"] = max(entry["max_latency"], call["latency"])
+        return list(result.values())
+
+    @classmethod
+    def export(cls, path, **sections):
+        """
+        Write the aggregated calls and further statistics as json
+
+        :param path: name of the json file
+        :param sections: further statistics, e.g. waits=Waiter.stats()
+        :return: the exported dict
+        """
+        data = dict(api=cls.stats(), **sections)
+        path = path_expand(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+        return data
@@ -0,0 +1,124 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudmesh.volume.AsyncVolumeABC import AsyncVolumeABC
+from cloudmesh.volume.ProviderPool import ProviderPool
+
+
+class AsyncProvider(AsyncVolumeABC):
+    """
+    Adapter that exposes a blocking volume provider through AsyncVolumeABC.
+    Every call is run in an executor, so the event loop stays free while the
+    provider waits for the cloud.
+
+    Usage::
+
+        results = AsyncProvider.run([
+            ("aws", "delete", {"name": "vol-1"}),
+            ("google", "delete", {"name": "vol-2"}),
+        ], parallel=16)
+    """
+
+    def __init__(self, name=None, provider=None, executor=None):
+        """
+        :param name: name of the cloud, used if no provider is given
+        :param provider: a cloudmesh.volume.Provider.Provider
+        :param executor: the executor the calls run in, None uses the default
+                         executor of the event loop
+        """
+        self.provider = provider or ProviderPool.get(name=name)
+        self.cloud = self.provider.cloud
+        self.executor = executor
+
+    async def _run(self, function, *args, **kwargs):
+        """
+        Run a blocking function in the executor
+
+        :return: the return value of the function
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    async def list(self, **kwargs):
+        return await self._run(self.provider.list, **kwargs)
+
+    async def create(self, **kwargs):
+        return await self._run(self.provider.create, **kwargs)
+
+    async def delete(self, name=None):
+        return await self._run(self.provider.delete, name=name)
+
+    async def delete_many(self, names=None):
+        return await self._run(self.provider.delete_many, names)
+
+    async def detach_many(self, names=None):
+        return await self._run(self.provider.detach_many, names)
+
+    async def attach(self, names=None, vm=None):
+        return await self._run(self.provider.attach, names=names, vm=vm)
+
+    async def detach(self, name=None):
+        return await self._run(self.provider.detach, name=name)
+
+    async def status(self, name=None):
+        return await self._run(self.provider.status, name=name)
+
+    async def add_tag(self, **kwargs):
+        return await self._run(self.provider.add_tag, **kwargs)
+
+    async def migrate(self, **kwargs):
+        return await self._run(self.provider.migrate, **kwargs)
+
+    async def sync(self, **kwargs):
+        return await self._run(self.provider.sync, **kwargs)
+
+    @staticmethod
+    async def gather(operations, parallel=16):
+        """
+        Run volume operations concurrently on the running event loop.
+
+        :param operations: list of (cloud, method, kwargs)
+        :param parallel: maximum number of operations in flight
+        :return: list of (cloud, result, error) in the order of operations
+        """
+        parallel = int(parallel)
+        executor = ThreadPoolExecutor(max_workers=parallel)
+        semaphore = asyncio.Semaphore(parallel)
+        providers = {}
+
+        async def call(cloud, method, kwargs):
+            async with semaphore:
+                try:
+                    if cloud not in providers:
+                        # building a provider blocks, keep it off the loop
+                        loop = asyncio.get_event_loop()
+                        provider = await loop.run_in_executor(
+                            executor, ProviderPool.get, cloud)
+                        providers[cloud] = AsyncProvider(provider=provider,
+                                                         executor=executor)
+                    result = await getattr(providers[cloud], method)(**kwargs)
+                    return cloud, result, None
+                except Exception as e:
+                    return cloud, None, e
+
+        try:
+            return await asyncio.gather(
+                *[call(cloud, method, kwargs)
+                  for cloud, method, kwargs in operations])
+        finally:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def run(operations, parallel=16):
+        """
+        Run volume operations concurrently on a new event loop. This is the
+        driver used by the volume command.
+
+        :param operations: list of (cloud, method, kwargs)
+        :param parallel: maximum number of operations in flight
+        :return: list of (cloud, result, error) in the order of operations
+        """
+        return asyncio.run(AsyncProvider.gather(operations,
+                                                parallel=parallel))
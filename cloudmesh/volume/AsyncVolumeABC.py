@@ -0,0 +1,96 @@
+from abc import ABCMeta, abstractmethod
+
+
+class AsyncVolumeABC(metaclass=ABCMeta):
+    """
+    The asyncio counterpart of VolumeABC. The methods have the same
+    parameters and return values as in VolumeABC, but they are coroutines so
+    that many volume operations across clouds can be awaited concurrently on
+    one event loop.
+    """
+
+    @abstractmethod
+    async def list(self, **kwargs):
+        """
+        List volumes, see VolumeABC.list
+
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create(self, **kwargs):
+        """
+        Create a volume, see VolumeABC.create
+
+        :return: dict of the created volume
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, name=None):
+        """
+        Delete a volume, see VolumeABC.delete
+
+        :param name: volume name
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def attach(self, names=None, vm=None):
+        """
+        Attach volumes to a vm, see VolumeABC.attach
+
+        :param names: volume names
+        :param vm: vm name which the volumes will be attached to
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def detach(self, name=None):
+        """
+        Detach a volume from its vm, see VolumeABC.detach
+
+        :param name: volume name
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def status(self, name=None):
+        """
+        Get the status of a volume, see VolumeABC.status
+
+        :param name: volume name
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_tag(self, **kwargs):
+        """
+        Add a tag to a volume, see VolumeABC.add_tag
+
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def migrate(self, **kwargs):
+        """
+        Migrate a volume to another vm, see VolumeABC.migrate
+
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def sync(self, **kwargs):
+        """
+        Synchronize two volumes, see VolumeABC.sync
+
+        :return: dict
+        """
+        raise NotImplementedError
@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+
+
+class FanOut(object):
+    """
+    Run a function over a number of keys (e.g. cloud names) on a bounded pool
+    of worker threads and hand back the results in the order in which they
+    arrive.
+
+    Each key gets its own timeout that starts when a worker picks it up. A key
+    that runs over its timeout is reported in self.timed_out and no longer
+    waited for. The workers are daemon threads, so a hanging cloud call does
+    not keep the command from returning.
+    """
+
+    def __init__(self, parallel=None, timeout=None):
+        """
+        :param parallel: maximum number of concurrent workers. If None one
+                         worker per key is used.
+        :param timeout: seconds a single key may take, None waits forever
+        """
+        self.parallel = parallel
+        self.timeout = None if timeout is None else float(timeout)
+        self.timed_out = []
+
+    def run(self, function, keys):
+        """
+        Call function(key) for all keys concurrently.
+
+        :param function: function called with a single key
+        :param keys: list of hashable keys
+        :return: generator of (key, result, error) tuples, error is the
+                 exception raised by function or None
+        """
+        keys = list(keys)
+        self.timed_out = []
+        if len(keys) == 0:
+            return
+        workers = len(keys)
+        if self.parallel:
+            workers = max(1, min(int(self.parallel), len(keys)))
+
+        tasks = queue.Queue()
+        results = queue.Queue()
+        started = {}
+        lock = threading.Lock()
+        for key in keys:
+            tasks.put(key)
+
+        def worker():
+            while True:
+                try:
+                    key = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                with lock:
+                    started[key] = time.monotonic()
+                try:
+                    results.put((key, function(key), None))
+                except Exception as e:
+                    results.put((key, None, e))
+
+        def start_worker():
+            threading.Thread(target=worker, daemon=True).start()
+
+        for i in range(workers):
+            start_worker()
+
+        pending = set(keys)
+        while pending:
+            try:
+                key, result, error = results.get(timeout=self._remaining(
+                    started, pending, lock))
+            except queue.Empty:
+                now = time.monotonic()
+                with lock:
+                    expired = [k for k in pending
+                               if k in started and
+                               now - started[k] >= self.timeout]
+                for key in expired:
+                    pending.discard(key)
+                    self.timed_out.append(key)
+                    # the worker of an expired key is stuck, replace it so
+                    # the remaining keys still get processed
+                    start_worker()
+                continue
+            if key not in pending:
+                # result arrived after the key timed out
+                continue
+            pending.discard(key)
+            yield key, result, error
+
+    def _remaining(self, started, pending, lock):
+        """
+        Seconds until the next running key times out.
+
+        :return: float or None if there is no timeout
+        """
+        if self.timeout is None:
+            return None
+        now = time.monotonic()
+        with lock:
+            running = [started[k] for k in pending if k in started]
+        if not running:
+            return 0.1
+        return max(0.0, min(running) + self.timeout - now)
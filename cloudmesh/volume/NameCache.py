@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import threading
+from time import time
+
+from cloudmesh.common.util import path_expand
+
+
+class NameCache(object):
+    """
+    Cache of resource names to cloud ids, e.g. the Name tag of an AWS volume
+    to its VolumeId.
+
+    Looking up an id by name costs a describe call with a tag filter. The
+    cache remembers the answer so that an operation that touches the same
+    volume several times only asks the cloud once. Entries expire after ttl
+    seconds. If a ttl is given the cache is also kept in a json file under
+    ~/.cloudmesh/volume/cache, so that it survives between two invocations of
+    the command. Operations that change names or delete resources have to
+    invalidate the affected entries.
+
+    Every cache counts its hits and misses, NameCache.stats() reports them
+    for all caches of the process.
+
+    Usage::
+
+        cache = NameCache("aws-volume", ttl=600)
+        volume_id = cache.get(name)
+        if volume_id is None:
+            volume_id = find_the_id(name)
+            cache.put(name, volume_id)
+    """
+
+    directory = "~/.cloudmesh/volume/cache"
+
+    caches = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, ttl=None):
+        """
+        :param name: name of the cache, also used as name of the file
+        :param ttl: seconds an entry is valid. If None the entries do not
+                    expire and the cache is not persisted.
+        """
+        self.name = name
+        self.ttl = None if ttl is None else float(ttl)
+        self.path = path_expand(os.path.join(self.directory, f"{name}.json"))
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.persistent:
+            self.load()
+            atexit.register(self.save)
+        with NameCache._lock:
+            NameCache.caches[name] = self
+
+    @property
+    def persistent(self):
+        return self.ttl is not None
+
+    def _expired(self, created):
+        return self.ttl is not None and time() - created > self.ttl
+
+    def get(self, name):
+        """
+        Look up the id of a name
+
+        :param name: name of the resource
+        :return: the id or None if it is not cached or expired
+        """
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is not None and self._expired(entry[1]):
+                del self.entries[name]
+                self._dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, name, value):
+        """
+        Remember the id of a name
+
+        :param name: name of the resource
+        :param value: id of the resource
+        """
+        if name is None or value is None:
+            return
+        with self._lock:
+            self.entries[name] = (value, time())
+            self._dirty = True
+
+    def invalidate(self, names=None):
+        """
+        Forget names
+
+        :param names: a name or list of names, None forgets all names
+        """
+        with self._lock:
+            if names is None:
+                self.entries = {}
+            else:
+                if isinstance(names, str):
+                    names = [names]
+                for name in names:
+                    self.entries.pop(name, None)
+            self._dirty = True
+
+    def load(self):
+        """
+        Read the entries that are not expired from the file of the cache
+        """
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.entries = {name: (value, created)
+                            for name, (value, created) in entries.items()
+                            if not self._expired(created)}
+
+    def save(self):
+        """
+        Write the entries to the file of the cache if they changed
+        """
+        if not self.persistent or not self._dirty:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(entries, f)
+
+    def counters(self):
+        """
+        The hits and misses of this cache
+
+        :return: dict with name, entries, hits, misses
+        """
+        return {
+            "name": self.name,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    @staticmethod
+    def clear_stats():
+        """
+        Set the hits and misses of all caches to zero, the entries are kept
+        """
+        with NameCache._lock:
+            caches = list(NameCache.caches.values())
+        for cache in caches:
+            with cache._lock:
+                cache.hits = 0
+                cache.misses = 0
+
+    @staticmethod
+    def stats():
+        """
+        The hits and misses of all caches
+
+        :return: list of dict with name, entries, hits, misses
+        """
+        with NameCache._lock:
+            caches = list(NameCache.caches.values())
+        return [cache.counters() for cache in caches]
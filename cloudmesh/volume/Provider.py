@@ -1,15 +1,99 @@
+import importlib
+from datetime import datetime
+
+try:
+    from importlib.metadata import EntryPoint
+    from importlib.metadata import entry_points
+except ImportError:
+    # python 3.7
+    from importlib_metadata import EntryPoint
+    from importlib_metadata import entry_points
+
 from cloudmesh.common.Printer import Printer
 from cloudmesh.common.console import Console
 from cloudmesh.common.variables import Variables
 from cloudmesh.configuration.Config import Config
-from cloudmesh.mongo.DataBaseDecorator import DatabaseUpdate
 from cloudmesh.mongo.CmDatabase import CmDatabase
+from cloudmesh.volume.FanOut import FanOut
+from cloudmesh.volume.Waiter import Waiter
+from cloudmesh.volume.WriteBehind import WriteBehind
+from cloudmesh.volume.WriteBehind import WriteBehindUpdate
 
 
 # class Provider(VolumeABC): # correct
 class Provider(object):  # broken
     kind = "volume"
 
+    # The providers are only imported when a cloud of their kind is used, so
+    # that a command only loads the SDK of the cloud it talks to. Additional
+    # providers can be registered by other packages with the entry point
+    # group "cloudmesh.volume.provider", e.g. in setup.py
+    #
+    #   entry_points={
+    #       "cloudmesh.volume.provider": [
+    #           "mycloud = cloudmesh.mycloud.volume.Provider:Provider"
+    #       ]
+    #   }
+    #
+    entry_point_group = "cloudmesh.volume.provider"
+
+    # the attribute holding the state of a volume and the states in which a
+    # newly created volume is ready to be used
+    state_keys = ["State", "status", "lifecycle_state", "disk_state"]
+
+    ready_states = ["available", "AVAILABLE", "READY", "Unattached"]
+
+    providers = {
+        "multipass": "cloudmesh.volume.multipass.Provider:Provider",
+        "aws": "cloudmesh.volume.aws.Provider:Provider",
+        "azure": "cloudmesh.volume.azure.Provider:Provider",
+        "google": "cloudmesh.volume.google.Provider:Provider",
+        "openstack": "cloudmesh.volume.openstack.Provider:Provider",
+        "oracle": "cloudmesh.volume.oracle.Provider:Provider",
+    }
+
+    _entry_points = None
+
+    @staticmethod
+    def _entry_point_list():
+        """
+        The entry points of the group Provider.entry_point_group
+
+        :return: list of EntryPoint
+        """
+        try:
+            return list(entry_points(group=Provider.entry_point_group))
+        except TypeError:
+            # python < 3.10 returns a dict of group -> entry points
+            return list(entry_points().get(Provider.entry_point_group, []))
+
+    @staticmethod
+    def _registry():
+        """
+        The built in providers together with the providers registered
+        through entry points. Entry points are only read, the modules they
+        point to are not imported.
+
+        :return: dict of kind -> "module:class", class or entry point
+        """
+        if Provider._entry_points is None:
+            Provider._entry_points = {}
+            for entry_point in Provider._entry_point_list():
+                Provider._entry_points[entry_point.name] = entry_point
+        registry = dict(Provider._entry_points)
+        registry.update(Provider.providers)
+        return registry
+
+    @staticmethod
+    def register(kind, provider):
+        """
+        Register a provider for a kind.
+
+        :param kind: the kind used in cm.kind of the cloud
+        :param provider: the provider class or a string "module:class"
+        """
+        Provider.providers[kind] = provider
+
     @staticmethod
     def get_kind():
         """
@@ -17,12 +101,7 @@ class Provider(object):  # broken
 
         :return: string
         """
-        kind = ["multipass",
-                "aws",
-                "azure",
-                "google",
-                "openstack",
-                "oracle"]
+        kind = list(Provider._registry().keys())
         return kind
 
     @staticmethod
@@ -33,41 +112,31 @@ class Provider(object):  # broken
         :param kind:
         :return:
         """
+        P = Provider._registry().get(kind)
 
-        if kind == "multipass":
-            from cloudmesh.volume.multipass.Provider import Provider as P
-
-        elif kind == "aws":
-            from cloudmesh.volume.aws.Provider import Provider as P
-
-        elif kind == "azure":
-            from cloudmesh.volume.azure.Provider import Provider as P
-
-        elif kind == "google":
-            from cloudmesh.volume.google.Provider import Provider as P
-
-        elif kind == "openstack":
-            from cloudmesh.volume.openstack.Provider import Provider as P
-
-        elif kind == "oracle":
-            from cloudmesh.volume.oracle.Provider import Provider as P
-
-        else:
+        if P is None:
             Console.error(f"Compute provider {kind} not supported")
 
             raise ValueError(f"Compute provider {kind} not supported")
 
+        if isinstance(P, EntryPoint):
+            P = P.load()
+        elif isinstance(P, str):
+            module, name = P.split(":")
+            P = getattr(importlib.import_module(module), name)
+
         return P
 
         # noinspection PyPep8Naming
 
-    def Print(self, data, kind=None, output="table"):
+    def Print(self, data, kind=None, output="table", max_age=None):
         """
         Print out the result dictionary as table(by default) or json.
 
         :param data: dic returned from volume functions
         :param kind: kind of provider
         :param output: "table" or "json"
+        :param max_age: if given, the age of the records is shown
         :return:
         """
         if kind is None and len(data) > 0:
@@ -75,6 +144,11 @@ class Provider(object):  # broken
         if output == "table":
             order = self.provider.output[kind]['order']
             header = self.provider.output[kind]['header']
+            if max_age is not None and isinstance(data, list):
+                # show how old the listed records are
+                data = [dict(entry, age=self._age(entry)) for entry in data]
+                order = order + ["age"]
+                header = header + ["Age(s)"]
             if 'humanize' in self.provider.output[kind]:
                 humanize = self.provider.output[kind]['humanize']
             else:
@@ -101,20 +175,10 @@ class Provider(object):  # broken
         except:
             Console.error(f"provider {name} not found in {configuration}")
             raise ValueError(f"provider {name} not found in {configuration}")
-        P = None
-        if self.kind in ["multipass",
-                         "aws",
-                         "azure",
-                         "google",
-                         "openstack",
-                         "oracle"]:
-            P = Provider.get_provider(self.kind)
-        if P is None:
-            Console.error(f"provider {name} not supported")
-            raise ValueError(f"provider {name} not supported")
+        P = Provider.get_provider(self.kind)
         self.provider = P(self.cloud)
 
-    @DatabaseUpdate()
+    @WriteBehindUpdate()
     def create(self, **kwargs):
         """
         Create a volume.
@@ -134,7 +198,78 @@ class Provider(object):  # broken
             raise ValueError("Volume could not be created")
         return data
 
-    @DatabaseUpdate()
+    def create_many(self, names, parallel=None, timeout=None, **kwargs):
+        """
+        Create many volumes concurrently. All creates are issued with at most
+        parallel requests in flight, then the volumes are polled until they
+        are ready, again concurrently. The resulting records are written to
+        the database in one bulk operation.
+
+           :param names (list): names of the volumes
+           :param parallel (integer): maximum number of concurrent requests
+           :param timeout (integer): seconds to wait for a volume to be ready
+           :param kwargs: the parameters passed to create for every volume
+           :return: list of dict
+        """
+        parallel = int(parallel or 16)
+        timeout = int(timeout or 360)
+
+        def create(name):
+            arguments = dict(kwargs)
+            arguments["NAME"] = name
+            return self.provider.create(**arguments)
+
+        created = []
+        for name, data, error in FanOut(parallel=parallel).run(create, names):
+            if error is not None:
+                Console.error(f"Volume {name} could not be created: {error}")
+            else:
+                created.append(name)
+
+        def ready(name):
+            return self._wait_ready(name, timeout=timeout)
+
+        records = []
+        for name, data, error in FanOut(parallel=parallel).run(ready, created):
+            if error is not None:
+                Console.error(f"Volume {name} did not get ready: {error}")
+            elif data:
+                records.extend(data)
+
+        WriteBehind.save(records)
+        if created:
+            variables = Variables()
+            variables["volume"] = created[-1]
+        return records
+
+    def _state(self, volume):
+        """
+        The state of a volume record independent of the provider
+
+        :param volume: dict
+        :return: string
+        """
+        for key in self.state_keys:
+            if key in volume:
+                return volume[key]
+        return None
+
+    def _wait_ready(self, name, timeout=360):
+        """
+        Poll the status of a volume until it is ready or the timeout passed
+
+        :param name: volume name
+        :param timeout: seconds to wait
+        :return: list of dict of the volume
+        """
+        waiter = Waiter("create", timeout=timeout)
+        return waiter.wait(
+            lambda: self.provider.status(name),
+            done=lambda data: bool(data) and
+            self._state(data[0]) in self.ready_states,
+            state=lambda data: self._state(data[0]) if data else None)
+
+    @WriteBehindUpdate()
     def delete(self, name=None):
         """
         Delete volumes.
@@ -146,7 +281,34 @@ class Provider(object):  # broken
         d = self.provider.delete(name)
         return d
 
-    @DatabaseUpdate()
+    def delete_many(self, names, parallel=None):
+        """
+        Delete many volumes. If the provider supports bulk deletion all
+        deletes are sent at once and their completion is tracked together,
+        otherwise the volumes are deleted concurrently one by one. The
+        resulting records are written to the database in one bulk operation.
+
+        :param names: list of volume names
+        :param parallel: maximum number of concurrent deletes for providers
+                         without bulk deletion
+        :return: list of dict
+        """
+        if hasattr(self.provider, "delete_many"):
+            records = self.provider.delete_many(names) or []
+        else:
+            records = []
+            fanout = FanOut(parallel=int(parallel or 16))
+            for name, data, error in fanout.run(self.provider.delete, names):
+                if error is not None:
+                    Console.error(f"Volume {name} could not be deleted: "
+                                  f"{error}")
+                elif isinstance(data, list):
+                    records.extend(data)
+                elif data:
+                    records.append(data)
+        WriteBehind.save(records)
+        return records
+
     def list(self, **kwargs):
         """
         This command list all volumes as follows:
@@ -159,16 +321,141 @@ class Provider(object):  # broken
         attaching to the vm. If region is given, under the current cloud,
         list all volumes in that region.
 
+        If max_age is given, the records stored in the database are returned
+        as long as none of them is older than max_age seconds. Otherwise the
+        volumes are listed from the cloud, which also refreshes the database.
+
         :param names: List of volume names
         :param vm: The name of the virtual machine
         :param region:  The name of the region
         :param cloud: The name of the cloud
         :param refresh: If refresh the information is taken from the cloud
+        :param max_age: seconds the stored records may be old
+        :return: dict
+        """
+        max_age = kwargs.pop("max_age", None)
+        if max_age is not None:
+            cached = self._cached(float(max_age), **kwargs)
+            if cached is not None:
+                return cached
+            kwargs = self._refresh_arguments(kwargs)
+        return self._list(**kwargs)
+
+    @WriteBehindUpdate()
+    def _list(self, **kwargs):
+        """
+        List the volumes through the provider and store them
+
         :return: dict
         """
+        # the provider may read the database, so it has to see all queued
+        # records
+        WriteBehind.flush()
         data = self.provider.list(**kwargs)
         return data
 
+    def stream(self, size=500, **kwargs):
+        """
+        List the volumes like list, but yield them in batches of at most
+        size volumes. If the provider can stream its listing, every batch
+        is written to the database and handed to the caller before the next
+        page is read from the cloud, so the memory does not grow with the
+        number of volumes. Other providers yield their listing as one batch.
+
+        :param size: number of volumes in a batch
+        :return: generator of list of dict
+        """
+        max_age = kwargs.pop("max_age", None)
+        if max_age is not None:
+            cached = self._cached(float(max_age), **kwargs)
+            if cached is not None:
+                yield cached
+                return
+            kwargs = self._refresh_arguments(kwargs)
+        if not kwargs.get("refresh") or not hasattr(self.provider, "stream"):
+            yield self._list(**kwargs)
+            return
+        WriteBehind.flush()
+        batch = []
+        for entry in self.provider.stream(**kwargs):
+            batch.append(entry)
+            if len(batch) >= size:
+                WriteBehind.write(batch)
+                yield batch
+                batch = []
+        if batch:
+            WriteBehind.write(batch)
+            yield batch
+
+    @staticmethod
+    def _refresh_arguments(kwargs):
+        """
+        The arguments to list the volumes from the cloud. The providers read
+        the arguments the volume command passes, so the ones missing in
+        kwargs are added as None.
+
+        :param kwargs: dict of the list arguments
+        :return: dict with refresh set to True
+        """
+        arguments = dict.fromkeys(["NAME", "NAMES", "vm", "region"])
+        arguments.update(kwargs)
+        arguments["refresh"] = True
+        return arguments
+
+    def _cached(self, max_age, **kwargs):
+        """
+        The stored volume records if they are not older than max_age.
+        Only the records of the requested names are checked, if a name has
+        no record the cloud is asked. Listings filtered by vm or region are
+        always taken from the cloud.
+
+        :param max_age: seconds the records may be old
+        :return: list of dict or None if the records are stale
+        """
+        if kwargs.get("vm") or kwargs.get("region"):
+            return None
+        WriteBehind.flush()
+        cm = CmDatabase()
+        records = cm.find(cloud=self.cloud, kind='volume')
+        records = [entry for entry in records or []
+                   if self._state(entry) != 'deleted']
+        names = kwargs.get("NAMES")
+        if kwargs.get("NAME"):
+            names = [kwargs["NAME"]]
+        elif isinstance(names, str):
+            names = [names]
+        if names:
+            records = [entry for entry in records
+                       if entry["cm"]["name"] in names]
+            # a volume without a record may exist in the cloud
+            if set(names) - {entry["cm"]["name"] for entry in records}:
+                return None
+        if len(records) == 0:
+            return None
+        # only the requested records have to be fresh, a refresh of some
+        # names does not update the others
+        if max(self._age(entry) for entry in records) > max_age:
+            return None
+        return records
+
+    @staticmethod
+    def _age(entry):
+        """
+        Seconds since a record was written to the database, 0 for records
+        that were just listed from the cloud
+
+        :param entry: dict
+        :return: float
+        """
+        modified = entry.get("cm", {}).get("modified")
+        if modified is None:
+            return 0.0
+        try:
+            modified = datetime.fromisoformat(str(modified))
+        except ValueError:
+            return float("inf")
+        return round((datetime.utcnow() - modified).total_seconds(), 1)
+
     def info(self, name=None):
         """
         Search through the list of volumes, find the matching volume with name,
@@ -192,7 +479,7 @@ class Provider(object):  # broken
         """
         return self.info(name=name)
 
-    @DatabaseUpdate()
+    @WriteBehindUpdate()
     def status(self, name=None):
         """
         This function returns status of volume, such as "available", "in-use"
@@ -204,20 +491,58 @@ class Provider(object):  # broken
         volume_status = self.provider.status(name)
         return volume_status
 
-    @DatabaseUpdate()
-    def attach(self, names=None, vm=None):
+    def status_many(self, names):
+        """
+        Get the status of many volumes. If the provider supports it the
+        volumes are read with a single batch request, otherwise one by one.
+        The records are written to the database in one bulk operation.
+
+        :param names: list of volume names
+        :return: list of dict
+        """
+        if hasattr(self.provider, "status_many"):
+            records = self.provider.status_many(names) or []
+        else:
+            records = []
+            for name in names:
+                records.extend(self.provider.status(name) or [])
+        WriteBehind.save(records)
+        return records
+
+    def _dryrun(self, operation):
+        """
+        Check that the provider supports a dry run of an operation. A dry
+        run is never passed to a provider that would ignore it and change
+        the volumes.
+
+        :param operation: attach, detach or migrate
+        :return: True if the provider supports the dry run
+        """
+        if operation in self.provider.dryrun_operations:
+            return True
+        Console.error(f"{self.cloud} does not support --dryrun for "
+                      f"{operation}, nothing was changed")
+        return False
+
+    @WriteBehindUpdate()
+    def attach(self, names=None, vm=None, dryrun=False):
         """
         Attach volume to a vm.
         If names is not specified, attach the most recent volume to vm.
 
         :param name: volume name
         :param vm: vm name which the volume will be attached to
+        :param dryrun: if True only show what would be done
         :return: dict
         """
+        if dryrun:
+            if not self._dryrun("attach"):
+                return []
+            return self.provider.attach(names, vm, dryrun=True)
         result = self.provider.attach(names, vm)
         return result
 
-    @DatabaseUpdate()
+    @WriteBehindUpdate()
     def detach(self, name=None):
         """
         Detach volumes from vm.
@@ -234,7 +559,42 @@ class Provider(object):  # broken
             raise ValueError("Volume could not be detached")
         return result
 
-    @DatabaseUpdate()
+    def detach_many(self, names, dryrun=False):
+        """
+        Detach many volumes. If the provider supports it the volumes are
+        detached together, e.g. with a single stop and start of each vm,
+        otherwise one after the other. The resulting records are written to
+        the database in one bulk operation.
+
+        :param names: list of volume names
+        :param dryrun: if True only show what would be done
+        :return: list of dict
+        """
+        if dryrun:
+            if not self._dryrun("detach"):
+                return []
+            return self.provider.detach_many(names, dryrun=True)
+        if hasattr(self.provider, "detach_many"):
+            records = self.provider.detach_many(names) or []
+        else:
+            records = []
+            for name in names:
+                try:
+                    data = self.provider.detach(name)
+                except Exception as e:
+                    Console.error(f"Volume {name} could not be detached: {e}")
+                    continue
+                if isinstance(data, list):
+                    records.extend(data)
+                elif data:
+                    records.append(data)
+        WriteBehind.save(records)
+        if records:
+            variables = Variables()
+            variables["volume"] = records[-1]["cm"]["name"]
+        return records
+
+    @WriteBehindUpdate()
     def add_tag(self, **kwargs):
         """
         This function add tag to a volume.
@@ -255,22 +615,86 @@ class Provider(object):  # broken
             raise ValueError("Tag could not be added")
         return result
 
-    @DatabaseUpdate()
+    def add_tag_many(self, names, key=None, value=None):
+        """
+        Add a tag to many volumes. If the provider supports it the tags are
+        added with batch requests, otherwise one volume after the other.
+        The records are written to the database in one bulk operation.
+
+        :param names: list of volume names
+        :param key: name of tag
+        :param value: value of tag
+        :return: list of dict
+        """
+        if hasattr(self.provider, "add_tag_many"):
+            records = self.provider.add_tag_many(names, key=key,
+                                                 value=value) or []
+        else:
+            records = []
+            for name in names:
+                records.append(self.provider.add_tag(NAME=name, key=key,
+                                                     value=value))
+        WriteBehind.save(records)
+        if records:
+            variables = Variables()
+            variables["volume"] = records[-1]["cm"]["name"]
+        return records
+
+    @WriteBehindUpdate()
     def migrate(self, **kwargs):
         """
         Migrate volume from one vm to another vm in the same cloud service.
 
         :param name (string): the volume name
         :param vm (string): the vm name
+        :param dryrun (boolean): if True only show what would be done
         :return: dict
         """
+        if kwargs.get("dryrun") and not self._dryrun("migrate"):
+            return []
         try:
             result = self.provider.migrate(**kwargs)
         except:
             raise ValueError("Volume could not be migrate")
         return result
 
-    @DatabaseUpdate()
+    def migrate_many(self, names, vm=None, parallel=None, dryrun=False):
+        """
+        Migrate many volumes to a vm. If the provider supports it the
+        volumes are migrated in a pipeline, otherwise one after the other.
+        The resulting records are written to the database in one bulk
+        operation.
+
+        :param names: list of volume names
+        :param vm: the vm name
+        :param parallel: maximum number of volumes migrated concurrently
+        :param dryrun: if True only show what would be done
+        :return: list of dict
+        """
+        if dryrun:
+            if not self._dryrun("migrate"):
+                return []
+            return self.provider.migrate_many(
+                names=names, vm=vm, parallel=parallel, dryrun=True)
+        if hasattr(self.provider, "migrate_many"):
+            records = self.provider.migrate_many(
+                names=names, vm=vm, parallel=parallel) or []
+        else:
+            records = []
+            for name in names:
+                try:
+                    data = self.provider.migrate(NAME=name, vm=vm)
+                except Exception as e:
+                    Console.error(f"Volume {name} could not be migrated: {e}")
+                    continue
+                if isinstance(data, list):
+                    records.extend(data)
+                elif data:
+                    records.append(data)
+        WriteBehind.save(records)
+        return records
+
+    @WriteBehindUpdate()
     def sync(self, **kwargs):
         """
         synchronize one volume with another volume in the same cloud service.
@@ -284,13 +708,14 @@ class Provider(object):  # broken
             raise ValueError("Volume could not be synchronized")
         return result
 
-    @DatabaseUpdate()
+    @WriteBehindUpdate()
     def purge(self, **kwargs):
         """
         purge deleted volumes in MongoDB database
 
         :return: dict
         """
+        WriteBehind.flush()
         collection = f"{self.cloud}-volume"
         self.cm = CmDatabase()
         if self.cloud == 'aws' or self.cloud == 'multipass':
@@ -0,0 +1,103 @@
+import os
+import threading
+
+from cloudmesh.common.util import path_expand
+from cloudmesh.volume.Provider import Provider
+
+
+class ProviderPool(object):
+    """
+    Process wide pool of volume providers keyed by cloud name.
+
+    Creating a Provider parses cloudmesh.yaml and builds the SDK client of the
+    cloud (boto3, ComputeManagementClient, CmDatabase, ...). The pool builds
+    each provider once and hands out the same object afterwards. When the
+    modification time of the configuration file changes, the providers that
+    were built from it are discarded and built again on the next request.
+
+    Usage::
+
+        provider = ProviderPool.get("aws")
+        print(ProviderPool.stats())
+    """
+
+    _providers = {}
+    _locks = {}
+    _lock = threading.Lock()
+
+    built = 0
+    saved = 0
+    invalidated = 0
+
+    @staticmethod
+    def _mtime(configuration):
+        """
+        The modification time of the configuration file
+
+        :param configuration: path of the yaml file
+        :return: float or None if the file does not exist
+        """
+        try:
+            return os.path.getmtime(path_expand(configuration))
+        except OSError:
+            return None
+
+    @classmethod
+    def get(cls, name=None, configuration="~/.cloudmesh/cloudmesh.yaml"):
+        """
+        Get the provider for a cloud, building it only if needed.
+
+        :param name: name of the cloud under cloudmesh.volume
+        :param configuration: path of the yaml file
+        :return: Provider
+        """
+        key = (name, path_expand(configuration))
+        with cls._lock:
+            lock = cls._locks.setdefault(key, threading.Lock())
+        # providers of different clouds can be built concurrently, but a
+        # single cloud is only built once
+        with lock:
+            mtime = cls._mtime(configuration)
+            entry = cls._providers.get(key)
+            if entry is not None:
+                if entry[0] == mtime:
+                    cls.saved += 1
+                    return entry[1]
+                cls.invalidated += 1
+            provider = Provider(name=name, configuration=configuration)
+            cls._providers[key] = (mtime, provider)
+            cls.built += 1
+            return provider
+
+    @classmethod
+    def clear(cls):
+        """
+        Remove all providers from the pool
+        """
+        with cls._lock:
+            cls._providers = {}
+            cls._locks = {}
+
+    @classmethod
+    def clear_stats(cls):
+        """
+        Set the counters of stats to zero, the providers are kept
+        """
+        with cls._lock:
+            cls.built = 0
+            cls.saved = 0
+            cls.invalidated = 0
+
+    @classmethod
+    def stats(cls):
+        """
+        Report how often providers were built and reused
+
+        :return: dict
+        """
+        return {
+            "built": cls.built,
+            "saved": cls.saved,
+            "invalidated": cls.invalidated,
+            "providers": len(cls._providers)
+        }
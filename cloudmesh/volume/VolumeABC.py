@@ -5,6 +5,9 @@ from cloudmesh.configuration.Config import Config
 
 class VolumeABC(metaclass=ABCMeta):
 
+    # operations that accept dryrun=True and then change nothing
+    dryrun_operations = []
+
     def __init__(self, cloud, path):
         # noinspection SpellCheckingInspection
         """
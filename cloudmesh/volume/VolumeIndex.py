@@ -0,0 +1,123 @@
+from cloudmesh.configuration.Config import Config
+from cloudmesh.volume.FanOut import FanOut
+from cloudmesh.volume.ProviderPool import ProviderPool
+
+
+class VolumeIndex(object):
+    """
+    Resolve volume names to the cloud that holds them. Every cloud is listed
+    exactly once and the volumes are kept in a dict keyed by name, so looking
+    up many names costs one listing per cloud instead of one listing per name
+    and cloud.
+
+    If a name exists in more than one cloud, the cloud that comes first in
+    cloudmesh.volume wins, which is the same order the volume command uses.
+    """
+
+    def __init__(self, clouds=None, parallel=None, timeout=None,
+                 max_age=None):
+        """
+        :param clouds: names of the clouds to index. If None all active
+                       clouds under cloudmesh.volume are used.
+        :param parallel: number of clouds listed concurrently
+        :param timeout: seconds a single cloud listing may take
+        :param max_age: use the stored records of a cloud if they are not
+                        older than max_age seconds
+        """
+        if clouds is None:
+            config = Config()
+            clouds = [cloud for cloud in config["cloudmesh.volume"].keys()
+                      if config[f"cloudmesh.volume.{cloud}.cm.active"]]
+        self.clouds = list(clouds)
+        self.parallel = parallel
+        self.timeout = timeout
+        self.max_age = max_age
+        self.volumes = {}
+        self.index = {}
+        self.listings = 0
+        self.failed = {}
+        self.timed_out = []
+
+    def scan(self):
+        """
+        List all clouds and yield their volumes as they arrive.
+
+        :return: generator of (cloud, volumes, error)
+        """
+
+        def listing(cloud):
+            provider = ProviderPool.get(name=cloud)
+            if self.max_age is not None:
+                return provider.list(max_age=self.max_age) or []
+            return provider.provider.list() or []
+
+        fanout = FanOut(parallel=self.parallel, timeout=self.timeout)
+        for cloud, result, error in fanout.run(listing, self.clouds):
+            self.listings += 1
+            if error is not None:
+                self.failed[cloud] = error
+                yield cloud, [], error
+                continue
+            volumes = result
+            self.volumes[cloud] = {}
+            for volume in volumes:
+                self.volumes[cloud].setdefault(volume["cm"]["name"], volume)
+            yield cloud, volumes, None
+        self.timed_out = fanout.timed_out
+        self._merge()
+
+    def build(self):
+        """
+        List all clouds and build the name index.
+
+        :return: self
+        """
+        for cloud, volumes, error in self.scan():
+            pass
+        return self
+
+    def _merge(self):
+        """
+        Combine the per cloud volumes into one index honoring the cloud order
+        """
+        self.index = {}
+        for cloud in reversed(self.clouds):
+            for name, volume in self.volumes.get(cloud, {}).items():
+                self.index[name] = (cloud, volume)
+
+    def resolve(self, name):
+        """
+        Find the cloud and volume for a name.
+
+        :param name: volume name
+        :return: (cloud, volume) or None
+        """
+        return self.index.get(name)
+
+    def group(self, names):
+        """
+        Group volume names by the cloud that holds them.
+
+        :param names: list of volume names
+        :return: (dict of cloud -> list of names, list of names not found)
+        """
+        groups = {}
+        missing = []
+        for name in names:
+            found = self.resolve(name)
+            if found is None:
+                missing.append(name)
+            else:
+                groups.setdefault(found[0], []).append(name)
+        ordered = {cloud: groups[cloud] for cloud in self.clouds
+                   if cloud in groups}
+        return ordered, missing
+
+    def provider(self, cloud):
+        """
+        The provider that was used to list the cloud.
+
+        :param cloud: name of the cloud
+        :return: Provider
+        """
+        return ProviderPool.get(name=cloud)
@@ -0,0 +1,205 @@
+import random
+import threading
+from collections import deque
+from time import monotonic
+from time import sleep
+
+from cloudmesh.common.console import Console
+
+
+class Waiter(object):
+    """
+    Poll a cloud resource until it reaches the expected state.
+
+    Instead of sleeping a fixed interval between two polls the waiter backs
+    off exponentially with some jitter, so that short operations return
+    quickly and long operations do not flood the API with requests. A hint
+    for the expected duration of a state lets the waiter sleep through most
+    of a state it knows to be slow, e.g. a snapshot in "pending", before it
+    starts to poll. The deadline is always honored.
+
+    Every wait is recorded in Waiter.metrics with the number of polls and the
+    time spent sleeping. Only the last Waiter.history waits of an operation
+    are kept, they are used to estimate how long the operation takes, see
+    Waiter.durations. Waiter.totals sums up all waits per operation until
+    Waiter.clear_stats is called.
+
+    Usage::
+
+        waiter = Waiter("detach", timeout=360, hints={"in-use": 5})
+        volume = waiter.wait(lambda: self.status(name=name)[0],
+                             done=lambda v: v['State'] == 'available',
+                             state=lambda v: v['State'])
+    """
+
+    history = 100
+
+    # operation -> deque of the last waits
+    metrics = {}
+    # operation -> dict with waits, polls, waited, timed_out
+    totals = {}
+    _lock = threading.Lock()
+
+    def __init__(self,
+                 operation=None,
+                 timeout=360,
+                 delay=1,
+                 max_delay=30,
+                 backoff=2,
+                 jitter=0.2,
+                 hints=None):
+        """
+        :param operation: name of the operation used in the metrics
+        :param timeout: seconds after which the wait is given up
+        :param delay: seconds to sleep after the first poll
+        :param max_delay: maximum seconds between two polls
+        :param backoff: factor by which the delay grows after each poll
+        :param jitter: fraction by which a delay is randomly varied
+        :param hints: dict of state -> expected seconds the state lasts
+        """
+        self.operation = operation
+        self.timeout = timeout
+        self.delay = delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.hints = hints or {}
+        self.polls = 0
+        self.waited = 0.0
+        self.timed_out = False
+
+    def wait(self, poll, done, state=None):
+        """
+        Poll until done returns True or the timeout is reached.
+
+        :param poll: function without arguments returning the current value
+        :param done: function that returns True if the value is final
+        :param state: function returning the state of a value, used to look
+                      up the hints
+        :return: the last value returned by poll
+        """
+        start = monotonic()
+        deadline = start + self.timeout
+        delay = self.delay
+        current = None
+        entered = start
+        self.polls = 0
+        self.waited = 0.0
+        self.timed_out = False
+        while True:
+            value = poll()
+            self.polls += 1
+            if done(value):
+                break
+            now = monotonic()
+            if now >= deadline:
+                self.timed_out = True
+                Console.warning(f"{self.operation or 'operation'} did not "
+                                f"finish within {self.timeout} seconds")
+                break
+            if state is not None:
+                s = state(value)
+                if s != current:
+                    current = s
+                    entered = now
+                    delay = self.delay
+            interval = delay
+            hint = self.hints.get(current)
+            if hint is not None and now - entered < hint:
+                # sleep through most of a state that is known to take long
+                interval = max(interval, hint - (now - entered))
+            interval = min(interval, self.max_delay)
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            interval = max(0.0, min(interval, deadline - now))
+            sleep(interval)
+            self.waited += interval
+            delay = delay * self.backoff
+        self._record(monotonic() - start)
+        return value
+
+    def _record(self, elapsed):
+        """
+        Add the metrics of the last wait to Waiter.metrics
+
+        :param elapsed: seconds the wait took
+        """
+        Waiter.add(self.operation,
+                   elapsed,
+                   polls=self.polls,
+                   waited=self.waited,
+                   timed_out=self.timed_out)
+
+    @staticmethod
+    def add(operation, elapsed, polls=0, waited=None, timed_out=False):
+        """
+        Add a wait to Waiter.metrics and Waiter.totals. This is also used
+        for waits that are not done by a Waiter, e.g. the waiters of an SDK.
+
+        :param operation: name of the operation
+        :param elapsed: seconds the wait took
+        :param polls: number of polls
+        :param waited: seconds spent sleeping, by default elapsed
+        :param timed_out: True if the wait was given up
+        """
+        if waited is None:
+            waited = elapsed
+        with Waiter._lock:
+            if operation not in Waiter.metrics:
+                Waiter.metrics[operation] = deque(maxlen=Waiter.history)
+            Waiter.metrics[operation].append({
+                "operation": operation,
+                "polls": polls,
+                "waited": round(waited, 3),
+                "elapsed": round(elapsed, 3),
+                "timed_out": timed_out
+            })
+            if operation not in Waiter.totals:
+                Waiter.totals[operation] = {"operation": operation,
+                                            "waits": 0,
+                                            "polls": 0,
+                                            "waited": 0.0,
+                                            "timed_out": 0}
+            total = Waiter.totals[operation]
+            total["waits"] += 1
+            total["polls"] += polls
+            total["waited"] = round(total["waited"] + waited, 3)
+            total["timed_out"] += int(timed_out)
+
+    @staticmethod
+    def durations(operation):
+        """
+        The seconds the last waits of an operation took
+
+        :param operation: name of the operation
+        :return: list of float, the oldest first
+        """
+        with Waiter._lock:
+            return [entry["elapsed"]
+                    for entry in Waiter.metrics.get(operation, [])]
+
+    @staticmethod
+    def stats():
+        """
+        The recorded waits per operation since the last clear_stats
+
+        :return: list of dict with operation, waits, polls, waited, timed_out
+        """
+        with Waiter._lock:
+            return [dict(total) for total in Waiter.totals.values()]
+
+    @staticmethod
+    def clear_stats():
+        """
+        Set the totals of stats to zero, the waits used by durations are kept
+        """
+        with Waiter._lock:
+            Waiter.totals = {}
+
+    @staticmethod
+    def clear():
+        """
+        Forget all waits
+        """
+        with Waiter._lock:
+            Waiter.metrics = {}
+            Waiter.totals = {}
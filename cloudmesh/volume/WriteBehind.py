@@ -0,0 +1,219 @@
+import atexit
+import functools
+import threading
+from datetime import datetime
+
+from cloudmesh.mongo.CmDatabase import CmDatabase
+from cloudmesh.mongo.DataBaseDecorator import DatabaseUpdate
+from pymongo import UpdateOne
+
+
+class WriteBehind(object):
+    """
+    Batched persistence of volume records.
+
+    Without write behind every provider call writes its result to MongoDB
+    right away, record by record. With write behind enabled the records are
+    queued and a flush writes them with a single bulk_write upsert per
+    {cloud}-volume collection. A flush happens at the end of a command, every
+    interval milliseconds if an interval is given, at exit, and whenever
+    WriteBehind.flush() is called by code that needs to read its own writes.
+
+    Usage::
+
+        WriteBehind.enable(interval=500)
+        provider.create(...)
+        WriteBehind.flush()
+    """
+
+    enabled = False
+    interval = None
+
+    flushes = 0
+    writes = 0
+
+    _queue = {}
+    _lock = threading.RLock()
+    _timer = None
+    _registered = False
+
+    @classmethod
+    def enable(cls, interval=None):
+        """
+        Queue records instead of writing them right away
+
+        :param interval: milliseconds between two automatic flushes, None
+                         only flushes explicitly and at exit
+        """
+        with cls._lock:
+            cls.enabled = True
+            cls.interval = interval
+            if not cls._registered:
+                atexit.register(cls.flush)
+                cls._registered = True
+            cls._schedule()
+
+    @classmethod
+    def disable(cls):
+        """
+        Flush the queue and write records right away from now on
+        """
+        with cls._lock:
+            cls.enabled = False
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+        cls.flush()
+
+    @classmethod
+    def _schedule(cls):
+        """
+        Start the timer for the next automatic flush
+        """
+        if not cls.enabled or not cls.interval:
+            return
+
+        def tick():
+            cls.flush()
+            with cls._lock:
+                cls._schedule()
+
+        cls._timer = threading.Timer(float(cls.interval) / 1000.0, tick)
+        cls._timer.daemon = True
+        cls._timer.start()
+
+    @staticmethod
+    def _records(data):
+        """
+        The records in a provider result that can be stored
+
+        :param data: dict, list of dict or None
+        :return: list of dict
+        """
+        if data is None:
+            return []
+        if isinstance(data, dict):
+            data = [data]
+        return [entry for entry in data
+                if isinstance(entry, dict) and "cm" in entry]
+
+    @classmethod
+    def add(cls, data):
+        """
+        Queue records. A later record with the same cloud, kind and name
+        replaces an earlier one.
+
+        :param data: dict or list of dict
+        """
+        with cls._lock:
+            for entry in cls._records(data):
+                collection = "{cloud}-{kind}".format(**entry["cm"])
+                key = (entry["cm"]["cloud"],
+                       entry["cm"]["kind"],
+                       entry["cm"]["name"])
+                cls._queue.setdefault(collection, {})[key] = entry
+
+    @classmethod
+    def save(cls, data):
+        """
+        Queue the records if write behind is enabled, otherwise write them
+        now with one bulk_write per collection
+
+        :param data: dict or list of dict
+        """
+        if cls.enabled:
+            cls.add(data)
+        else:
+            cls.write(data)
+
+    @classmethod
+    def flush(cls):
+        """
+        Write all queued records
+
+        :return: dict of collection -> pymongo BulkWriteResult
+        """
+        with cls._lock:
+            queue = cls._queue
+            cls._queue = {}
+        results = {}
+        for collection, entries in queue.items():
+            results.update(cls.write(list(entries.values())))
+        if results:
+            cls.flushes += 1
+        return results
+
+    @classmethod
+    def write(cls, data):
+        """
+        Upsert records with a single bulk_write per collection
+
+        :param data: dict or list of dict
+        :return: dict of collection -> pymongo BulkWriteResult
+        """
+        now = str(datetime.utcnow())
+        operations = {}
+        for entry in cls._records(data):
+            collection = "{cloud}-{kind}".format(**entry["cm"])
+            entry["cm"]["collection"] = collection
+            entry["cm"]["modified"] = now
+            document = {key: value for key, value in entry.items()
+                        if key not in ["_id", "cm"]}
+            for key, value in entry["cm"].items():
+                if key != "created":
+                    document[f"cm.{key}"] = value
+            operations.setdefault(collection, []).append(UpdateOne(
+                {"cm.kind": entry["cm"]["kind"],
+                 "cm.cloud": entry["cm"]["cloud"],
+                 "cm.name": entry["cm"]["name"]},
+                {"$set": document,
+                 "$setOnInsert": {"cm.created": now}},
+                upsert=True))
+        results = {}
+        if operations:
+            cm = CmDatabase()
+            for collection, requests in operations.items():
+                results[collection] = cm.collection(collection).bulk_write(
+                    requests, ordered=False)
+                cls.writes += len(requests)
+        return results
+
+    @staticmethod
+    def command(f):
+        """
+        Decorator for a command: records are queued while the command runs
+        and flushed when it returns.
+        """
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            WriteBehind.enable(interval=WriteBehind.interval)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                WriteBehind.disable()
+
+        return wrapper
+
+
+class WriteBehindUpdate(object):
+    """
+    Replacement for cloudmesh.mongo.DataBaseDecorator.DatabaseUpdate. If
+    write behind is enabled the result of the decorated method is queued,
+    otherwise it is written right away with DatabaseUpdate.
+    """
+
+    def __call__(self, f):
+        update = DatabaseUpdate()(f)
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not WriteBehind.enabled:
+                return update(*args, **kwargs)
+            current = f(*args, **kwargs)
+            if type(current) == dict:
+                current = [current]
+            WriteBehind.add(current)
+            return current
+
+        return wrapper
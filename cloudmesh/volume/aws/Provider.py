@@ -1,15 +1,27 @@
+import threading
+from time import monotonic
 from time import sleep
 
 import boto3
+from botocore.exceptions import ClientError
+from botocore.exceptions import WaiterError
 from cloudmesh.common.console import Console
 from cloudmesh.configuration.Config import Config
+from cloudmesh.volume.ApiStats import ApiStats
+from cloudmesh.volume.FanOut import FanOut
+from cloudmesh.volume.NameCache import NameCache
 from cloudmesh.volume.VolumeABC import VolumeABC
+from cloudmesh.volume.Waiter import Waiter
+from cloudmesh.volume.WriteBehind import WriteBehind
 from cloudmesh.mongo.CmDatabase import CmDatabase
 
 
 class Provider(VolumeABC):
     kind = "volume"
 
+    # operations that EC2 checks with DryRun=True without changing anything
+    dryrun_operations = ['attach']
+
     sample = """
     cloudmesh:
       volume:
@@ -29,6 +41,8 @@ class Provider(VolumeABC):
             region_name: {region_name}
             region: {availability_zone}
             snapshot: "None"
+            waiter_delay: 5
+            waiter_max_attempts: 72
           credentials:
             EC2_SECURITY_GROUP: default
             EC2_ACCESS_ID: {aws_access_key_id}
@@ -87,6 +101,12 @@ class Provider(VolumeABC):
         }
     }
 
+    # device names for attached volumes, sdX and xvdX share a slot
+    devices = ([f"/dev/sd{c}" for c in "fghijklmnop"] +
+               [f"/dev/xvd{c}" for c in "bcdeqrstuvwxyz"] +
+               [f"/dev/xvd{p}{c}" for p in "bc"
+                for c in "abcdefghijklmnopqrstuvwxyz"])
+
     def __init__(self, name=None):
         """
         Initialize provider, create boto3 ec2 client, get the default dict.
@@ -101,9 +121,27 @@ class Provider(VolumeABC):
                                    region_name=self.default['region_name'],
                                    aws_access_key_id=self.cred['EC2_ACCESS_ID'],
                                    aws_secret_access_key=self.cred[
-                                       'EC2_SECRET_KEY']
+                                       'EC2_SECRET_KEY'],
+                                   endpoint_url=self.default.get(
+                                       'endpoint_url')
                                    )
+        ApiStats.register(self.client)
         self.cm = CmDatabase()
+        self.vm_name_cache = {}
+        # name -> id caches, kept between invocations if cache_ttl is set
+        ttl = self.default.get('cache_ttl')
+        self.volume_ids = NameCache(f"{self.cloud}-volume-id", ttl=ttl)
+        self.vm_ids = NameCache(f"{self.cloud}-vm-id", ttl=ttl)
+        # seconds between two polls and polls of the EC2 waiters
+        self.waiter_delay = int(self.default.get('waiter_delay', 5))
+        self.waiter_max_attempts = int(
+            self.default.get('waiter_max_attempts', 72))
+        self._device_lock = threading.Lock()
+        self._reserved_devices = {}
+        # seconds spent per stage by the last migrate
+        self.timings = {}
+        # client of the EBS direct API, created when sync needs it
+        self.ebs = None
 
     def update_dict(self, results):
         """
@@ -198,14 +236,31 @@ class Provider(VolumeABC):
         :param vm: the name of vm.
         :return: dict
         """
+        vm_id = self.vm_ids.get(vm)
+        if vm_id is not None:
+            vm_info = self.client.describe_instances(
+                Filters=[{'Name': 'instance-id', 'Values': [vm_id, ]}])
+            instances = [instance
+                         for reservation in vm_info['Reservations']
+                         for instance in reservation['Instances']]
+            if instances \
+                    and instances[0]['State']['Name'] != 'terminated' \
+                    and {'Key': 'Name', 'Value': vm} in \
+                    instances[0].get('Tags', []):
+                return vm_info
+            # deleted, terminated or renamed outside of cloudmesh, look it
+            # up by name again
+            self.vm_ids.invalidate(vm)
         vm_info = self.client.describe_instances(
-            Filters=[
-                {
-                    'Name': 'tag:Name',
-                    'Values': [vm, ]
-                },
-            ]
-        )
+            Filters=[{'Name': 'tag:Name', 'Values': [vm, ]},
+                     {'Name': 'instance-state-name',
+                      'Values': ['pending', 'running', 'shutting-down',
+                                 'stopping', 'stopped']}])
+        try:
+            self.vm_ids.put(
+                vm, vm_info['Reservations'][0]['Instances'][0]['InstanceId'])
+        except (KeyError, IndexError):
+            self.vm_ids.invalidate(vm)
         return vm_info
 
     def find_vm_info_from_volume_name(self, volume_name=None):
@@ -227,18 +282,12 @@ class Provider(VolumeABC):
             ],
         )
         elements = volume['Volumes']
-        for i in range(len(elements)):
-            try:
-                for item in elements[i]['Attachments']:
-                    vm_id = item['InstanceId']
-                    instance = client.describe_instances(InstanceIds=[vm_id])
-                    for tag in instance['Reservations'][0]['Instances'][0][
-                        'Tags']:
-                        if tag['Key'] == 'Name':
-                            vm_name = tag['Value']
-                        return vm_name
-            except:
-                Console.error(f"{volume_name} does not attach to any vm")
+        for entry in elements:
+            ids = [item['InstanceId'] for item in entry['Attachments']]
+            for vm_name in self.vm_names(ids).values():
+                if vm_name is not None:
+                    return vm_name
+        Console.error(f"{volume_name} does not attach to any vm")
 
     def update_AttachedToVm(self, data):
         """
@@ -248,27 +297,75 @@ class Provider(VolumeABC):
         attach to one vm.
         Only IOPS io1 volumes can attach to multiple vms (creating of io1 volume
         is not implemented)
+        The names of all instances the volumes are attached to are looked up
+        together with vm_names.
 
         :param data: volume dict
         :return: dict
         """
         elements = data['Volumes']
-        for i in range(len(elements)):
-            elements[i]['AttachedToVm'] = []
-            try:
-                for item in elements[i]['Attachments']:
-                    vm_id = item['InstanceId']
-                    instance = self.client.describe_instances(
-                        InstanceIds=[vm_id])
-                    for tag in instance['Reservations'][0]['Instances'][0][
-                        'Tags']:
-                        if tag['Key'] == 'Name':
-                            vm_name = tag['Value']
-                            elements[i]['AttachedToVm'].append(vm_name)
-            except:
-                pass
+        ids = [item['InstanceId']
+               for entry in elements
+               for item in entry.get('Attachments', [])]
+        names = self.vm_names(ids)
+        for entry in elements:
+            entry['AttachedToVm'] = []
+            for item in entry.get('Attachments', []):
+                vm_name = names.get(item['InstanceId'])
+                if vm_name is not None:
+                    entry['AttachedToVm'].append(vm_name)
         return data
 
+    def vm_names(self, ids):
+        """
+        This function finds the Name tags of instances. The ids that were not
+        looked up before are described together in chunks of 1000, and the
+        names are remembered until the next listing starts.
+
+        :param ids: list of instance ids
+        :return: dict of instance id -> name, None for instances without name
+        """
+        missing = sorted(set(ids) - set(self.vm_name_cache))
+        for chunk in self._chunks(missing, 1000):
+            for instance in self._describe_instances(chunk):
+                vm_name = None
+                for tag in instance.get('Tags', []):
+                    if tag['Key'] == 'Name':
+                        vm_name = tag['Value']
+                self.vm_name_cache[instance['InstanceId']] = vm_name
+            for vm_id in chunk:
+                # instances that no longer exist have no name either
+                self.vm_name_cache.setdefault(vm_id, None)
+        return {vm_id: self.vm_name_cache[vm_id] for vm_id in ids}
+
+    def _describe_instances(self, ids):
+        """
+        This function describes instances by id page by page. If one of the
+        ids does not exist anymore, the ids are looked up with an instance-id
+        filter instead, which ignores unknown ids.
+
+        :param ids: list of at most 1000 instance ids
+        :return: generator of instance dicts
+        """
+        paginator = self.client.get_paginator('describe_instances')
+        try:
+            pages = list(paginator.paginate(InstanceIds=ids))
+        except ClientError:
+            pages = []
+            for chunk in self._chunks(ids, 200):
+                pages.extend(paginator.paginate(
+                    Filters=[
+                        {
+                            'Name': 'instance-id',
+                            'Values': chunk
+                        },
+                    ]
+                ))
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    yield instance
+
     def find_volume_id(self, volume_name):
         """
         This function find volume_id through volume_name
@@ -276,6 +373,9 @@ class Provider(VolumeABC):
         :param volume_name: the name of volume
         :return: string
         """
+        volume_id = self.volume_ids.get(volume_name)
+        if volume_id is not None:
+            return volume_id
         volume = self.client.describe_volumes(
             Filters=[
                 {
@@ -285,8 +385,52 @@ class Provider(VolumeABC):
             ],
         )
         volume_id = volume['Volumes'][0]['VolumeId']
+        self.volume_ids.put(volume_name, volume_id)
         return volume_id
 
+    @staticmethod
+    def _error_code(error):
+        """
+        The error code of a ClientError, e.g. InvalidVolume.NotFound
+
+        :param error: ClientError
+        :return: string
+        """
+        return error.response.get('Error', {}).get('Code', '')
+
+    @staticmethod
+    def _not_found(error):
+        """
+        True if a ClientError reports that a volume, instance or snapshot
+        does not exist
+
+        :param error: ClientError
+        :return: boolean
+        """
+        return Provider._error_code(error).endswith('.NotFound')
+
+    def _retry_stale(self, call, volumes=(), vms=()):
+        """
+        Call a function that uses the cached ids of volumes or vms. If an id
+        does not exist anymore, e.g. because the volume was deleted and
+        created again outside of cloudmesh, the cached ids of the names are
+        forgotten and the function is called once more, so that the ids are
+        looked up again by the Name tag.
+
+        :param call: function without arguments
+        :param volumes: names of the volumes whose ids the function uses
+        :param vms: names of the vms whose ids the function uses
+        :return: the result of call
+        """
+        try:
+            return call()
+        except ClientError as e:
+            if not self._not_found(e):
+                raise
+            self.volume_ids.invalidate(list(volumes))
+            self.vm_ids.invalidate(list(vms))
+            return call()
+
     def find_vm_id(self, vm_name):
         """
         This function find vm_id through vm_name
@@ -294,6 +438,9 @@ class Provider(VolumeABC):
         :param vm_name: the name of vom
         :return: string
         """
+        vm_id = self.vm_ids.get(vm_name)
+        if vm_id is not None:
+            return vm_id
         instance = self.client.describe_instances(
             Filters=[
                 {
@@ -303,6 +450,7 @@ class Provider(VolumeABC):
             ],
         )
         vm_id = instance['Reservations'][0]['Instances'][0]['InstanceId']
+        self.vm_ids.put(vm_name, vm_id)
         return vm_id
 
     def wait(self,
@@ -317,6 +465,41 @@ class Provider(VolumeABC):
         sleep(time)
         return False
 
+    def _wait(self, name, operation=None, delay=None, max_attempts=None,
+              **kwargs):
+        """
+        This function waits with one of the EC2 waiters of botocore, e.g.
+        volume_available, volume_in_use, volume_deleted or
+        snapshot_completed. All volume or snapshot ids are passed to a
+        single waiter, which polls them with one describe call. The time of
+        the wait is added to the Waiter metrics.
+
+        :param name: name of the botocore waiter
+        :param operation: name of the operation for the wait metrics
+        :param delay: seconds between two polls, default waiter_delay
+        :param max_attempts: maximum number of polls, default
+                             waiter_max_attempts
+        :param kwargs: arguments of the describe call, e.g. VolumeIds
+        :return: True if the resources reached the state
+        """
+        delay = delay or self.waiter_delay
+        max_attempts = max_attempts or self.waiter_max_attempts
+        start = monotonic()
+        timed_out = False
+        try:
+            self.client.get_waiter(name).wait(
+                WaiterConfig={'Delay': delay, 'MaxAttempts': max_attempts},
+                **kwargs)
+        except WaiterError as e:
+            timed_out = True
+            Console.warning(f"{operation or name} did not finish: {e}")
+        elapsed = monotonic() - start
+        Waiter.add(operation or name,
+                   elapsed,
+                   polls=int(elapsed // delay) + 1,
+                   timed_out=timed_out)
+        return not timed_out
+
     def status(self, name):
         """
         This function get volume status, such as "in-use", "available",
@@ -325,18 +508,37 @@ class Provider(VolumeABC):
         :param name
         :return: dict
         """
-        result = self.client.describe_volumes(
-            Filters=[
-                {
-                    'Name': 'tag:Name',
-                    'Values': [name, ]
-                },
-            ],
-        )
+        result = self._describe_volume(name)
         result = self.update_dict(result)
         # volume_status = volume['Volumes'][0]['State']
         return result
 
+    def _describe_volume(self, name):
+        """
+        This function describes a volume by name. If the id of the volume is
+        cached, the volume is described by id, which does not fail for a
+        deleted volume but returns no volume.
+
+        :param name: name of volume
+        :return: dict returned by describe_volumes
+        """
+        volume_id = self.volume_ids.get(name)
+        if volume_id is not None:
+            filters = [{'Name': 'volume-id', 'Values': [volume_id, ]}]
+        else:
+            filters = [{'Name': 'tag:Name', 'Values': [name, ]}]
+        result = self.client.describe_volumes(Filters=filters)
+        if volume_id is not None and (
+                not result['Volumes'] or
+                self._volume_name(result['Volumes'][0]) != name):
+            # deleted or renamed outside of cloudmesh, look it up by name
+            # again
+            self.volume_ids.invalidate(name)
+            return self._describe_volume(name)
+        if result['Volumes']:
+            self.volume_ids.put(name, result['Volumes'][0]['VolumeId'])
+        return result
+
     def create(self, **kwargs):
         """
         This function create a new volume, with defalt parameters in
@@ -361,6 +563,8 @@ class Provider(VolumeABC):
                 kwargs[key] = self.default[key]
 
         result = self._create(**kwargs)
+        self.volume_ids.invalidate(kwargs['NAME'])
+        self.volume_ids.put(kwargs['NAME'], result['Volumes'][0]['VolumeId'])
         result = self.update_dict(result)
         return result
 
@@ -444,53 +648,7 @@ class Provider(VolumeABC):
         :return: dict of volume
         """
         if kwargs and kwargs['refresh']:
-            result = self.client.describe_volumes()
-            for key in kwargs:
-                if key == 'NAME' and kwargs['NAME']:
-                    result = self.client.describe_volumes(
-                        # DryRun=dryrun,
-                        Filters=[
-                            {
-                                'Name': 'tag:Name',
-                                'Values': [kwargs['NAME'], ]
-                            },
-                        ],
-                    )
-                elif key == 'NAMES' and kwargs['NAMES']:
-                    if type(kwargs['NAMES']) == str:
-                        kwargs['NAMES'] = [kwargs['NAMES']]
-                    result = self.client.describe_volumes(
-                        # DryRun=dryrun,
-                        Filters=[
-                            {
-                                'Name': 'tag:Name',
-                                'Values': kwargs['NAMES'],
-                            },
-                        ],
-                    )
-                elif key == 'vm' and kwargs['vm']:
-                    vm_id = self.find_vm_id(kwargs['vm'])
-                    result = self.client.describe_volumes(
-                        # DryRun=dryrun,
-                        Filters=[
-                            {
-                                'Name': 'attachment.instance-id',
-                                'Values': [vm_id, ]
-                            },
-                        ],
-                    )
-                elif key == 'region' and kwargs['region']:
-                    result = self.client.describe_volumes(
-                        # DryRun=dryrun,
-                        Filters=[
-                            {
-                                'Name': 'availability-zone',
-                                'Values': [kwargs['region'], ]
-                            },
-                        ],
-                    )
-            result = self.update_AttachedToVm(result)
-            result = self.update_dict(result)
+            result = [entry for entry in self.stream(**kwargs)]
         elif kwargs and not kwargs['refresh']:
             result = self.cm.find(cloud=self.cloud, kind='volume')
             for key in kwargs:
@@ -506,11 +664,76 @@ class Provider(VolumeABC):
                                           query={'AvailabilityZone': kwargs[
                                               'region']})
         else:
-            result = self.client.describe_volumes()
-            result = self.update_AttachedToVm(result)
-            result = self.update_dict(result)
+            result = [entry for entry in self.stream()]
         return result
 
+    def filters(self, **kwargs):
+        """
+        This function compiles the arguments of list into the Filters of a
+        single describe_volumes request. All given filters have to match.
+
+        :param NAME: name of volume
+        :param NAMES: names of volumes
+        :param vm: name of vm
+        :param region: name of availability zone
+        :param tags: dict of tag key -> value
+        :return: list of dict
+        """
+        filters = []
+        names = []
+        if kwargs.get('NAME'):
+            names.append(kwargs['NAME'])
+        if kwargs.get('NAMES'):
+            if type(kwargs['NAMES']) == str:
+                kwargs['NAMES'] = [kwargs['NAMES']]
+            names.extend(kwargs['NAMES'])
+        if names:
+            filters.append({'Name': 'tag:Name', 'Values': names})
+        if kwargs.get('vm'):
+            filters.append({'Name': 'attachment.instance-id',
+                            'Values': [self.find_vm_id(kwargs['vm']), ]})
+        if kwargs.get('region'):
+            filters.append({'Name': 'availability-zone',
+                            'Values': [kwargs['region'], ]})
+        for key, value in (kwargs.get('tags') or {}).items():
+            filters.append({'Name': f'tag:{key}', 'Values': [value, ]})
+        return filters
+
+    def stream(self, **kwargs):
+        """
+        This function lists the volumes from the cloud page by page with the
+        describe_volumes paginator and yields the normalized volume dicts
+        one by one, so that only one page is held in memory. All filters
+        are sent with the same request, see filters.
+
+        :param NAME: name of volume
+        :param NAMES: names of volumes
+        :param vm: name of vm
+        :param region: name of availability zone
+        :param tags: dict of tag key -> value
+        :param page_size: number of volumes requested per page
+        :return: generator of dict of volume
+        """
+        parameters = {
+            'PaginationConfig': {
+                'PageSize': int(kwargs.get('page_size') or
+                                self.default.get('page_size', 500))
+            }
+        }
+        filters = self.filters(**kwargs)
+        if filters:
+            parameters['Filters'] = filters
+        # the provider is pooled, the vm names of an earlier command may
+        # belong to renamed or terminated instances
+        self.vm_name_cache = {}
+        paginator = self.client.get_paginator('describe_volumes')
+        for page in paginator.paginate(**parameters):
+            page = self.update_AttachedToVm(page)
+            for entry in self.update_dict(page):
+                if entry['State'] != 'deleted':
+                    self.volume_ids.put(entry['cm']['name'], entry['VolumeId'])
+                yield entry
+
     def delete(self, name):
         """
         This function delete one volume.
@@ -520,31 +743,123 @@ class Provider(VolumeABC):
         :param NAME (string): volume name
         :return: dict
         """
-        result = self.client.describe_volumes(
-            Filters=[
-                {
-                    'Name': 'tag:Name',
-                    'Values': [name]
-                },
-            ], )
-        volume_id = self.find_volume_id(name)
+        result = self._describe_volume(name)
+        volume_id = result['Volumes'][0]['VolumeId']
         if result['Volumes'][0]['State'] == 'available':
             response = self.client.delete_volume(VolumeId=volume_id)
-            stop_timeout = 360
-            time = 0
-            while time <= stop_timeout:
-                sleep(5)
-                time += 5
-                try:
-                    volume_status = self.status(name=name)[0]['State']
-                except:
-                    break
+            self._wait('volume_deleted', operation='delete',
+                       VolumeIds=[volume_id])
+            self.volume_ids.invalidate(name)
             result['Volumes'][0]['State'] = 'deleted'
         else:
             Console.error("volume is not available")
         result = self.update_dict(result)
         return result
 
+    def delete_many(self, names, timeout=360, interval=None):
+        """
+        This function deletes many volumes. All delete requests are sent
+        up front, then every poll describes all pending volumes with a
+        volume-id filter, 200 ids per call. A volume is deleted when it is
+        missing from the result or its state is deleted. The progress is
+        reported after every poll that found deleted volumes, the volumes
+        that are left after the timeout are reported as stragglers.
+
+        :param names (list): volume names
+        :param timeout (int): seconds to wait for the deletion
+        :param interval (int): seconds between two polls, default
+                               waiter_delay
+        :return: list of dict with "State" updated as "deleted"
+        """
+        interval = interval or self.waiter_delay
+        volumes = []
+        for chunk in self._chunks(names, 200):
+            volumes.extend(self.client.describe_volumes(
+                Filters=[
+                    {
+                        'Name': 'tag:Name',
+                        'Values': chunk
+                    },
+                ],
+            )['Volumes'])
+
+        pending = {}
+        for volume in volumes:
+            name = self._volume_name(volume)
+            if volume['State'] != 'available':
+                Console.error(f"volume {name} is not available")
+                continue
+            try:
+                self.client.delete_volume(VolumeId=volume['VolumeId'])
+                pending[volume['VolumeId']] = volume
+            except Exception as e:
+                Console.error(f"volume {name} could not be deleted: {e}")
+        total = len(pending)
+
+        deleted = []
+
+        def poll():
+            states = {}
+            for chunk in self._chunks(list(pending), 200):
+                response = self.client.describe_volumes(
+                    Filters=[
+                        {
+                            'Name': 'volume-id',
+                            'Values': chunk
+                        },
+                    ],
+                )
+                for volume in response['Volumes']:
+                    states[volume['VolumeId']] = volume['State']
+            before = len(deleted)
+            for volume_id in list(pending):
+                state = states.get(volume_id, 'deleted')
+                pending[volume_id]['State'] = state
+                if state == 'deleted':
+                    deleted.append(pending.pop(volume_id))
+            if len(deleted) > before:
+                Console.msg(f"{len(deleted)} of {total} volumes deleted")
+            return len(pending)
+
+        # a volume_deleted waiter can not be used for many ids: it succeeds
+        # as soon as one of them is not found, while the filter ignores the
+        # volumes that are gone
+        waiter = Waiter('delete_many', timeout=timeout, delay=interval,
+                        max_delay=interval, backoff=1, jitter=0)
+        waiter.wait(poll, done=lambda remaining: remaining == 0)
+
+        self.volume_ids.invalidate(
+            [self._volume_name(volume) for volume in deleted])
+        for volume in pending.values():
+            Console.warning(f"volume {self._volume_name(volume)} is still "
+                            f"{volume['State']} after {timeout} seconds")
+        return self.update_dict({'Volumes': deleted + list(pending.values())})
+
+    @staticmethod
+    def _chunks(values, size):
+        """
+        Split a list into lists of at most size elements
+
+        :param values: list
+        :param size: maximum length of a chunk
+        :return: generator of lists
+        """
+        for i in range(0, len(values), size):
+            yield values[i:i + size]
+
+    @staticmethod
+    def _volume_name(volume):
+        """
+        The value of the Name tag of a volume
+
+        :param volume: dict returned by describe_volumes
+        :return: string
+        """
+        for tag in volume.get('Tags', []):
+            if tag['Key'] == 'Name':
+                return tag['Value']
+        return volume['VolumeId']
+
     def attach(self,
                names,
                vm,
@@ -554,33 +869,143 @@ class Provider(VolumeABC):
         This function attach one or more volumes to vm. It returns self.list()
         to list the updated volume. The updated dict with "AttachedToVm" showing
         the name of vm where the volume attached to.
+        The block device mappings of the vm are read once, every volume gets
+        a free device name from self.devices and all volumes are attached
+        concurrently.
 
         :param names (string): names of volumes
         :param vm (string): name of vm
         :param dryrun (boolean): True|False
         :return: dict of volume
         """
-        devices = [
-            "/dev/sdb",
-            "/dev/sdd",
-            "/dev/sde",
-            "/dev/sdf",
-            "/dev/sdg",
-            "/dev/sdh", ]
-        vm_id = self.find_vm_id(vm)
+        instance = self.vm_info(vm)['Reservations'][0]['Instances'][0]
+        volume_ids = {name: self.find_volume_id(name) for name in names}
+        attached = self._attach_volumes(vm, instance['InstanceId'],
+                                        volume_ids, dryrun=dryrun,
+                                        instance=instance, cached=True)
+        if attached:
+            self._wait('volume_in_use', operation='attach',
+                       VolumeIds=attached)
+        return self.list(NAMES=names, refresh=True)
+
+    def _attach_volumes(self, vm, vm_id, volume_ids, dryrun=False,
+                        instance=None, cached=False):
+        """
+        This function attaches volumes by id to a vm concurrently, every
+        volume on a device chosen by plan_devices. It does not wait for the
+        attachments to complete.
+
+        :param vm: name of vm, used in the messages
+        :param vm_id: instance id
+        :param volume_ids: dict of volume name -> volume id
+        :param dryrun (boolean): True|False
+        :param instance: dict of the instance if it was already described
+        :param cached: True if the volume ids are taken from the name cache,
+                       an id that does not exist anymore is then looked up
+                       again by name
+        :return: list of the ids of the volumes that are attaching
+        """
+        names = list(volume_ids)
+        plan = self.plan_devices(vm_id, names, instance=instance)
+
+        def attach_volume(name):
+            def attach():
+                return self.client.attach_volume(
+                    Device=plan[name],
+                    InstanceId=vm_id,
+                    VolumeId=self.find_volume_id(name) if cached
+                    else volume_ids[name],
+                    DryRun=dryrun
+                )
+
+            try:
+                if cached:
+                    response = self._retry_stale(attach, volumes=[name])
+                    volume_ids[name] = self.find_volume_id(name)
+                    return response
+                return attach()
+            except ClientError as e:
+                # with DryRun=True EC2 reports a request that would have
+                # succeeded as the error DryRunOperation
+                if dryrun and self._error_code(e) == 'DryRunOperation':
+                    return None
+                raise
+            finally:
+                self.release_devices(vm_id, [plan[name]])
+
         for name in names:
-            volume_id = self.find_volume_id(name)
+            if name not in plan:
+                Console.error(f"no free device on {vm} for volume {name}")
+        attached = []
+        fanout = FanOut()
+        for name, response, error in fanout.run(attach_volume, list(plan)):
+            if error is not None:
+                Console.error(f"volume {name} could not be attached to "
+                              f"{vm} as {plan[name]}: {error}")
+            elif dryrun:
+                Console.msg(f"volume {name} would be attached to {vm} as "
+                            f"{plan[name]}")
+            else:
+                attached.append(volume_ids[name])
+        return attached
+
+    @staticmethod
+    def _slot(device):
+        """
+        The slot of a device name. /dev/sdf and /dev/xvdf use the same slot,
+        partitions such as /dev/sda1 use the slot of their disk.
+
+        :param device: device name
+        :return: string
+        """
+        slot = device.replace("/dev/", "")
+        for prefix in ["xvd", "sd"]:
+            if slot.startswith(prefix):
+                slot = slot[len(prefix):]
+                break
+        return slot.rstrip("0123456789")
+
+    def plan_devices(self, vm_id, names, instance=None):
+        """
+        This function assigns free device names of a vm to volumes. The
+        devices in use are read from the BlockDeviceMappings of the vm, and
+        the chosen devices are reserved until release_devices is called, so
+        that concurrent attaches to the same vm do not pick the same device.
+
+        :param vm_id: instance id
+        :param names: names of the volumes
+        :param instance: dict of the instance, described if not given
+        :return: dict of volume name -> device name, volumes for which no
+                 device is left are missing
+        """
+        if instance is None:
+            instance = self.client.describe_instances(
+                InstanceIds=[vm_id])['Reservations'][0]['Instances'][0]
+        used = {self._slot(mapping['DeviceName'])
+                for mapping in instance.get('BlockDeviceMappings', [])}
+        if 'RootDeviceName' in instance:
+            used.add(self._slot(instance['RootDeviceName']))
+        plan = {}
+        with self._device_lock:
+            reserved = self._reserved_devices.setdefault(vm_id, set())
+            free = [device for device in self.devices
+                    if self._slot(device) not in used | reserved]
+            for name, device in zip(names, free):
+                plan[name] = device
+                reserved.add(self._slot(device))
+        return plan
+
+    def release_devices(self, vm_id, devices):
+        """
+        This function releases devices reserved by plan_devices
+
+        :param vm_id: instance id
+        :param devices: device names
+        """
+        with self._device_lock:
+            reserved = self._reserved_devices.get(vm_id, set())
             for device in devices:
-                try:
-                    response = self.client.attach_volume(
-                        Device=device,
-                        InstanceId=vm_id,
-                        VolumeId=volume_id,
-                        DryRun=dryrun
-                    )
-                except:
-                    pass
-        return self.list(NAMES=names, refresh=True)
+                reserved.discard(self._slot(device))
 
     def detach(self,
                name):
@@ -593,20 +1018,26 @@ class Provider(VolumeABC):
         :param name: name of volume to detach
         :return: dict of volume
         """
-        volume_status = self.status(name=name)[0]['State']
-        if volume_status == 'in-use':
-            volume_id = self.find_volume_id(volume_name=name)
-            rresponse = self.client.detach_volume(VolumeId=volume_id)
-        stop_timeout = 360
-        time = 0
-        while time <= stop_timeout:
-            sleep(5)
-            time += 5
-            volume_status = self.status(name=name)[0]['State']
-            if volume_status == "available":
-                break
+        volume = self.status(name=name)[0]
+        volume_id = volume['VolumeId']
+        if volume['State'] == 'in-use':
+            self._detach_volume(volume)
+        self._wait('volume_available', operation='detach',
+                   VolumeIds=[volume_id])
         return self.list(NAME=name, refresh=True)[0]
 
+    def _detach_volume(self, volume):
+        """
+        Detach a volume from the instances in its attachments. The instance
+        is passed with the volume, as not every implementation of the EC2
+        API finds it from the volume alone.
+
+        :param volume: dict of the volume
+        """
+        for attachment in volume.get('Attachments', []):
+            self.client.detach_volume(VolumeId=volume['VolumeId'],
+                                      InstanceId=attachment['InstanceId'])
+
     def add_tag(self, **kwargs):
 
         """
@@ -623,19 +1054,23 @@ class Provider(VolumeABC):
         """
         key = kwargs['key']
         value = kwargs['value']
+        self._retry_stale(
+            lambda: self.client.create_tags(
+                Resources=[
+                    self.find_volume_id(volume_name=kwargs['NAME']),
+                ],
+                Tags=[
+                    {
+                        'Key': key,
+                        'Value': value
+                    },
+                ],
+            ),
+            volumes=[kwargs['NAME']])
         volume_id = self.find_volume_id(volume_name=kwargs['NAME'])
-        re = self.client.create_tags(
-            Resources=[
-                volume_id,
-            ],
-            Tags=[
-                {
-                    'Key': key,
-                    'Value': value
-                },
-            ],
-        )
         if key == 'Name':
+            self.volume_ids.invalidate(kwargs['NAME'])
+            self.volume_ids.put(value, volume_id)
             result = self.list(NAME=value, refresh=True)[0]
         else:
             result = self.list(NAME=kwargs['NAME'], refresh=True)[0]
@@ -650,91 +1085,281 @@ class Provider(VolumeABC):
         :param region (string): the availability zone
         :return: dict of volume
         """
-        volume_name = kwargs['NAME']
-        vm = kwargs['vm']
-        volume_status = self.status(name=volume_name)[0]['State']
-        volume_region = self.list(NAME=volume_name, refresh=True)[0]['cm'][
-            'region']
-        volume_id = self.find_volume_id(volume_name=volume_name)
+        return self.migrate_many(names=[kwargs['NAME']], vm=kwargs['vm'])[0]
+
+    def migrate_many(self, names, vm, parallel=None):
+        """
+        Migrate volumes from their vms to another vm.
+
+        Volumes in the availability zone of the vm are detached together and
+        attached together. Volumes in another zone are copied: the snapshots
+        of all of them are requested first, and every volume then moves on
+        by itself as soon as its previous stage is done: wait for the
+        snapshot, create the volume in the zone of the vm, wait until it is
+        available, attach it, detach and delete the old volume. The time
+        spent in each stage is reported at the end and kept in
+        self.timings.
+
+        :param names (list): the volume names
+        :param vm (string): the vm name
+        :param parallel (int): number of volumes copied concurrently
+        :return: list of dict of volume
+        """
+        self.timings = {}
+        lock = threading.Lock()
+
+        def stage(name, function):
+            start = monotonic()
+            try:
+                return function()
+            finally:
+                with lock:
+                    self.timings.setdefault(name, []).append(
+                        monotonic() - start)
+
         vm_info = self.vm_info(vm=vm)
-        vm_status = vm_info['Reservations'][0]['Instances'][0]['State']['Name']
-        vm_region = vm_info['Reservations'][0]['Instances'][0]['Placement'][
-            'AvailabilityZone']
-        vm_id = self.find_vm_id(vm_name=vm)
-
-        # migrate within same region:
-        if vm_status == 'running':
-            if volume_region == vm_region:
-                if volume_status == "in-use":
-                    self.detach(name=volume_name)
-                    self.attach(names=[volume_name, ], vm=vm)
-                elif volume_status == "available":
-                    self.attach(names=[volume_name, ], vm=vm)
-                return self.list(NAME=volume_name, refresh=True)
-            else:
-                snapshot_id = self.client.create_snapshot(
-                    VolumeId=volume_id, )['SnapshotId']
-                ec2 = boto3.resource('ec2')
-                snapshot = ec2.Snapshot(snapshot_id)
-                start_timeout = 360
-                time = 0
-                while time <= start_timeout:
-                    sleep(5)
-                    time += 5
-                    if snapshot.state == "completed":
-                        break
-                kwargs['snapshot'] = snapshot_id
-                kwargs['region'] = vm_region
-                new_volume = self.create(name=volume_name, **kwargs)
-                start_timeout = 360
-                time = 0
-                while time <= start_timeout:
-                    sleep(5)
-                    time += 5
-                    status = self.status(name=volume_name)[0]['State']
-                    if status == "available":
-                        break
-                self.attach(names=[volume_name, ], vm=vm)
-                response = self.client.delete_volume(VolumeId=volume_id)
-        else:
+        instance = vm_info['Reservations'][0]['Instances'][0]
+        if instance['State']['Name'] != 'running':
             Console.error("vm is not available")
-        result = self.list(NAME=kwargs['NAME'], refresh=True)[0]
-        return result
+            return self.list(NAMES=names, refresh=True)
+        vm_id = instance['InstanceId']
+        vm_region = instance['Placement']['AvailabilityZone']
+
+        volumes = {entry['cm']['name']: entry
+                   for entry in self.stream(NAMES=names)}
+        for name in names:
+            if name not in volumes:
+                Console.error(f"volume {name} not found")
+        local = [name for name in volumes
+                 if volumes[name]['AvailabilityZone'] == vm_region]
+        remote = [name for name in volumes if name not in local]
+
+        # volumes in the zone of the vm are moved
+        if local:
+            in_use = [volumes[name]['VolumeId'] for name in local
+                      if volumes[name]['State'] == 'in-use']
+            if in_use:
+                def detach():
+                    for name in local:
+                        if volumes[name]['State'] == 'in-use':
+                            self._detach_volume(volumes[name])
+                    self._wait('volume_available', operation='migrate',
+                               VolumeIds=in_use)
+
+                stage('detach', detach)
+            attached = stage('attach', lambda: self._attach_volumes(
+                vm, vm_id, {name: volumes[name]['VolumeId']
+                            for name in local}))
+            if attached:
+                stage('in-use', lambda: self._wait(
+                    'volume_in_use', operation='migrate', VolumeIds=attached))
+
+        # volumes in other zones are copied
+        snapshots = {}
+        for name in remote:
+            snapshots[name] = stage(
+                'snapshot', lambda: self.client.create_snapshot(
+                    VolumeId=volumes[name]['VolumeId'], )['SnapshotId'])
+
+        def copy(name):
+            volume = volumes[name]
+            stage('snapshot-wait', lambda: self._wait(
+                'snapshot_completed', operation='migrate',
+                SnapshotIds=[snapshots[name]]))
+            new_volume = stage('create', lambda: self.create(
+                NAME=name,
+                size=volume['Size'],
+                volume_type=volume['VolumeType'],
+                encrypted=volume['Encrypted'],
+                region=vm_region,
+                snapshot=snapshots[name]))[0]
+            stage('available', lambda: self._wait(
+                'volume_available', operation='migrate',
+                VolumeIds=[new_volume['VolumeId']]))
+            attached = stage('attach', lambda: self._attach_volumes(
+                vm, vm_id, {name: new_volume['VolumeId']}))
+            if attached:
+                stage('in-use', lambda: self._wait(
+                    'volume_in_use', operation='migrate', VolumeIds=attached))
+
+            def delete():
+                if volume['State'] == 'in-use':
+                    self._detach_volume(volume)
+                    self._wait('volume_available', operation='migrate',
+                               VolumeIds=[volume['VolumeId']])
+                self.client.delete_volume(VolumeId=volume['VolumeId'])
+
+            stage('delete', delete)
+
+        fanout = FanOut(parallel=parallel)
+        for name, result, error in fanout.run(copy, remote):
+            if error is not None:
+                Console.error(f"volume {name} could not be migrated: {error}")
+
+        for name, timings in self.timings.items():
+            Console.msg(f"{name}: {len(timings)} volumes, "
+                        f"total {sum(timings):.1f}s, "
+                        f"max {max(timings):.1f}s")
+        return self.list(NAMES=names, refresh=True)
 
     def sync(self, **kwargs):
         """
         sync contents of one volume to another volume
 
+        The content of the second volume is copied to the first volume
+        through a snapshot. The snapshot a target was last synced from and
+        a snapshot of the target taken right after the sync are recorded in
+        the {cloud}-sync collection. EBS snapshots are incremental, so the
+        next snapshots of the same volumes only store the blocks changed
+        since then. If the EBS direct API reports no changed blocks for the
+        source and for the target, the target still equals the source and
+        is kept, which saves deleting, creating and initializing the target
+        volume. Otherwise the target is recreated from the new snapshot and
+        the recorded snapshots are deleted.
+
         :param NAMES (list): list of volume names
         :return: dict
         """
         volume_1 = kwargs['NAMES'][0]
         volume_1_region = self.list(NAME=volume_1, refresh=True)[0]['cm'][
             'region']
-        volume_2 = kwargs['NAMES'][0]
+        volume_2 = kwargs['NAMES'][1]
+        snapshot_id = self._snapshot(volume_2)
         volume_2_id = self.find_volume_id(volume_name=volume_2)
-        snapshot_id = self.client.create_snapshot(
-            VolumeId=volume_2_id, )['SnapshotId']
-        ec2 = boto3.resource('ec2')
-        snapshot = ec2.Snapshot(snapshot_id)
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            if snapshot.state == "completed":
-                break
+
+        lineage = self.lineage(volume_1)
+        target_snapshot_id = None
+        if lineage is not None \
+                and lineage.get('target_snapshot_id') \
+                and lineage['source_id'] == volume_2_id \
+                and lineage['target_id'] == self.find_volume_id(volume_1):
+            # the target may have been written to since the last sync
+            target_snapshot_id = self._snapshot(volume_1)
+        self._wait('snapshot_completed', operation='sync',
+                   SnapshotIds=[snapshot for snapshot in
+                                [snapshot_id, target_snapshot_id]
+                                if snapshot is not None])
+
+        if target_snapshot_id is not None:
+            unchanged = \
+                self.changed_blocks(lineage['snapshot_id'],
+                                    snapshot_id) == 0 and \
+                self.changed_blocks(lineage['target_snapshot_id'],
+                                    target_snapshot_id) == 0
+            # the recorded snapshot of the target stays the reference
+            self._delete_snapshots([target_snapshot_id])
+            if unchanged:
+                # nothing changed, the new snapshot is not needed
+                self._delete_snapshots([snapshot_id])
+                return self.list(NAME=volume_1, refresh=True)[0]
+
         self.delete(name=volume_1)
         kwargs = {'region': volume_1_region, 'snapshot': snapshot_id,
                   'NAME': volume_1}
         new_volume = self.create(**kwargs)
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            status = self.status(name=volume_1)[0]['State']
-            if status == "available":
-                break
+        target_id = new_volume[0]['VolumeId']
+        self._wait('volume_available', operation='sync',
+                   VolumeIds=[target_id])
+        # the reference to find out whether the target is written to
+        target_snapshot_id = self.client.create_snapshot(
+            VolumeId=target_id)['SnapshotId']
+        self._wait('snapshot_completed', operation='sync',
+                   SnapshotIds=[target_snapshot_id])
+        if lineage is not None:
+            self._delete_snapshots(
+                [snapshot for snapshot in [lineage.get('snapshot_id'),
+                                           lineage.get('target_snapshot_id')]
+                 if snapshot and snapshot != snapshot_id])
+        WriteBehind.save({
+            'cm': {
+                'cloud': self.cloud,
+                'kind': 'sync',
+                'name': volume_1
+            },
+            'source': volume_2,
+            'source_id': volume_2_id,
+            'snapshot_id': snapshot_id,
+            'target_id': target_id,
+            'target_snapshot_id': target_snapshot_id
+        })
         return self.list(NAME=volume_1, refresh=True)[0]
 
+    def _snapshot(self, name):
+        """
+        This function starts a snapshot of a volume, it does not wait for
+        the snapshot to complete.
+
+        :param name: name of the volume
+        :return: snapshot id
+        """
+        return self._retry_stale(
+            lambda: self.client.create_snapshot(
+                VolumeId=self.find_volume_id(volume_name=name),
+            )['SnapshotId'],
+            volumes=[name])
+
+    def _delete_snapshots(self, snapshot_ids):
+        """
+        This function deletes snapshots, a snapshot that can not be deleted
+        is reported.
+
+        :param snapshot_ids: list of snapshot ids
+        """
+        for snapshot_id in snapshot_ids:
+            try:
+                self.client.delete_snapshot(SnapshotId=snapshot_id)
+            except ClientError as e:
+                Console.warning(f"snapshot {snapshot_id} could not be "
+                                f"deleted: {e}")
+
+    def lineage(self, name):
+        """
+        This function finds the snapshot a volume was last synced from.
+
+        :param name: name of the target volume
+        :return: dict with source, source_id, snapshot_id, target_id and
+                 target_snapshot_id or None if the volume was never synced
+        """
+        WriteBehind.flush()
+        records = self.cm.find(collection=f"{self.cloud}-sync",
+                               query={'cm.name': name})
+        if not records:
+            return None
+        return records[0]
+
+    def changed_blocks(self, first, second):
+        """
+        This function checks with the EBS direct API whether blocks differ
+        between two snapshots of the same volume. The ebs client can be
+        replaced, e.g. by a fake in tests.
+
+        :param first: id of the older snapshot
+        :param second: id of the newer snapshot
+        :return: 0 if no block changed, a positive number if blocks changed,
+                 None if the snapshots can not be compared
+        """
+        if self.ebs is None:
+            self.ebs = boto3.client('ebs',
+                                    region_name=self.default['region_name'],
+                                    aws_access_key_id=self.cred[
+                                        'EC2_ACCESS_ID'],
+                                    aws_secret_access_key=self.cred[
+                                        'EC2_SECRET_KEY'],
+                                    endpoint_url=self.default.get(
+                                        'endpoint_url')
+                                    )
+            ApiStats.register(self.ebs)
+        arguments = {'FirstSnapshotId': first, 'SecondSnapshotId': second}
+        try:
+            while True:
+                response = self.ebs.list_changed_blocks(**arguments)
+                if response.get('ChangedBlocks'):
+                    # one changed block is enough to know
+                    return len(response['ChangedBlocks'])
+                if not response.get('NextToken'):
+                    return 0
+                arguments['NextToken'] = response['NextToken']
+        except ClientError as e:
+            Console.warning(f"snapshots {first} and {second} can not be "
+                            f"compared: {e}")
+            return None
@@ -1,3 +1,6 @@
+import functools
+
+from cloudmesh.common.Printer import Printer
 from cloudmesh.common.console import Console
 from cloudmesh.common.debug import VERBOSE
 from cloudmesh.common.parameter import Parameter
@@ -8,13 +11,59 @@ from cloudmesh.management.configuration.name import Name as VolumeName
 from cloudmesh.shell.command import PluginCommand
 from cloudmesh.shell.command import command
 from cloudmesh.shell.command import map_parameters
-from cloudmesh.volume.Provider import Provider
+from cloudmesh.volume.ApiStats import ApiStats
+from cloudmesh.volume.AsyncProvider import AsyncProvider
+from cloudmesh.volume.NameCache import NameCache
+from cloudmesh.volume.ProviderPool import ProviderPool
+from cloudmesh.volume.VolumeIndex import VolumeIndex
+from cloudmesh.volume.Waiter import Waiter
+from cloudmesh.volume.WriteBehind import WriteBehind
+
+
+def stats(f):
+    """
+    Decorator for do_volume: if --stats is given, the statistics of the
+    command are printed as tables and exported as json when it returns.
+    The statistics are process wide, so they are cleared when the command
+    starts, otherwise a cms shell would also report the earlier commands.
+    """
+
+    @functools.wraps(f)
+    def wrapper(self, args, arguments):
+        if arguments.get("--stats"):
+            ApiStats.clear()
+            ProviderPool.clear_stats()
+            NameCache.clear_stats()
+            Waiter.clear_stats()
+        try:
+            return f(self, args, arguments)
+        finally:
+            if arguments.get("--stats"):
+                sections = {
+                    "waits": Waiter.stats(),
+                    "providers": [ProviderPool.stats()],
+                    "caches": NameCache.stats()
+                }
+                data = ApiStats.export("~/.cloudmesh/volume/stats.json",
+                                       **sections)
+                for name, entries in data.items():
+                    banner(name)
+                    if entries:
+                        print(Printer.write(entries,
+                                            order=list(entries[0].keys()),
+                                            output="table"))
+                Console.ok("statistics written to "
+                           "~/.cloudmesh/volume/stats.json")
+
+    return wrapper
 
 
 class VolumeCommand(PluginCommand):
 
     # noinspection PyUnusedLocal
     @command
+    @stats
+    @WriteBehind.command
     def do_volume(self, args, arguments):
         """
         ::
@@ -27,6 +76,10 @@ class VolumeCommand(PluginCommand):
                         [--refresh]
                         [--dryrun]
                         [--output=FORMAT]
+                        [--parallel=N]
+                        [--timeout=SECONDS]
+                        [--max_age=SECONDS]
+                        [--stats]
             volume create [NAME]
                         [--size=SIZE]
                         [--volume_type=TYPE]
@@ -34,19 +87,27 @@ class VolumeCommand(PluginCommand):
                         [--dryrun]
                         [--region=REGION]
                         [--path=PATH]
-            volume attach [NAMES] [--vm=VM]
-            volume detach [NAMES]
-            volume delete [NAMES]
-            volume add_tag [NAME]
+                        [--parallel=N]
+                        [--timeout=SECONDS]
+                        [--stats]
+            volume attach [NAMES] [--vm=VM] [--dryrun] [--stats]
+            volume detach [NAMES] [--parallel=N] [--dryrun] [--stats]
+            volume delete [NAMES] [--parallel=N] [--stats]
+            volume add_tag [NAMES]
                         [--key=KEY]
                         [--value=VALUE]
-            volume status [NAME]
-            volume migrate [NAME]
+                        [--stats]
+            volume status [NAMES] [--stats]
+            volume migrate [NAMES]
                         [--vm=VM]
                         [--cloud=CLOUD]
+                        [--parallel=N]
+                        [--dryrun]
+                        [--stats]
             volume sync [NAMES]
                         [--cloud=CLOUD]
-            volume purge [--cloud=CLOUD]
+                        [--stats]
+            volume purge [--cloud=CLOUD] [--stats]
 
           This command manages volumes across different clouds
 
@@ -65,6 +126,15 @@ class VolumeCommand(PluginCommand):
               --value=VALUE        The value of tag key
               --snapshot           The snapshot of volume
               --path=PATH          The path of local volume
+              --parallel=N         Run the operations concurrently with at
+                                   most N in flight
+              --timeout=SECONDS    Time a single cloud may take before it is
+                                   skipped
+              --max_age=SECONDS    Use the stored volume records if they are
+                                   not older than SECONDS
+              --stats              Print the API calls, waits, provider and
+                                   name cache statistics of the command and
+                                   write them to ~/.cloudmesh/volume/stats.json
 
           Description:
 
@@ -75,7 +145,17 @@ class VolumeCommand(PluginCommand):
                         [--refresh]
                         [--dryrun]
                         [--output=FORMAT]
+                        [--parallel=N]
+                        [--timeout=SECONDS]
+                        [--max_age=SECONDS]
                 List all the volumes for certain vm, region, or cloud.
+                With --max_age the volumes stored in the database are shown
+                as long as they are not older than SECONDS, otherwise they
+                are refreshed from the cloud. The age of each record is
+                shown in the table.
+                If NAMES are given without a cloud and --parallel is
+                specified, all active clouds are searched concurrently and
+                the results are printed as they arrive.
 
             volume create [NAME]
                           [--size=SIZE]
@@ -84,26 +164,46 @@ class VolumeCommand(PluginCommand):
                           [--dryrun]
                           [--snapshot=SNAPSHOT]
                           [--region=REGION]
-                Creates a volume
+                          [--parallel=N]
+                          [--timeout=SECONDS]
+                Creates a volume. NAME can be a range such as
+                user-vol-[1-100], in which case the volumes are created
+                concurrently with at most N requests in flight (default 16)
+                and --timeout limits the wait for each volume to get ready.
 
             volume status [NAMES]
                           [--cloud=CLOUD]
-                Get the status (e.g. 'available', 'READY', 'in-use') of a volume
+                Get the status (e.g. 'available', 'READY', 'in-use') of a volume.
+                The status of several volumes is read with batch requests
+                where the provider supports it.
 
             volume attach [NAMES]
                           [--vm=VM]
+                          [--dryrun]
                 Attach volume to a vm
 
-            volume detach [NAMES]
-                Detach volume from a vm
+            volume detach [NAMES] [--parallel=N] [--dryrun]
+                Detach volume from a vm. On clouds that stop a vm to change
+                its disks all volumes of a vm are detached in a single
+                stop/start window. With --dryrun the planned vm restarts and
+                their estimated downtime are shown.
 
-            volume delete [NAMES]
-                Delete the named volumes
+            volume delete [NAMES] [--parallel=N]
+                Delete the named volumes. All deletes of a cloud are sent at
+                once and their completion is tracked together. The clouds
+                are processed concurrently with --parallel.
 
-            volume migrate [NAME]
+            volume migrate [NAMES]
                            [--vm=VM]
                            [--cloud=CLOUD]
+                           [--parallel=N]
+                           [--dryrun]
                  Migrate volume from one vm to another vm in the same provider.
+                 Several volumes are migrated in a pipeline where the provider
+                 supports it, --parallel limits the volumes copied
+                 concurrently. On clouds that stop a vm to change its disks
+                 every vm is stopped and started once, --dryrun shows the
+                 planned restarts and their estimated downtime.
 
             volume sync [NAMES]
                         [--cloud=CLOUD]
@@ -167,7 +267,10 @@ class VolumeCommand(PluginCommand):
                        "key",
                        "value",
                        "snapshot",
-                       "path"
+                       "path",
+                       "parallel",
+                       "timeout",
+                       "max_age"
                        )
 
         arguments.output = Parameter.find("output",
@@ -177,64 +280,76 @@ class VolumeCommand(PluginCommand):
 
         cloud = variables['cloud']
 
+        def list_volumes(provider):
+            # tables are printed page by page as the volumes arrive, the
+            # other formats need the complete listing to stay a valid
+            # document
+            if arguments.output == "table":
+                for result in provider.stream(**arguments):
+                    provider.Print(result,
+                                   kind='volume',
+                                   output=arguments.output,
+                                   max_age=arguments.max_age)
+            else:
+                result = provider.list(**arguments)
+                provider.Print(result,
+                               kind='volume',
+                               output=arguments.output,
+                               max_age=arguments.max_age)
+
         if arguments.list:
             if arguments.NAMES:
                 names = Parameter.expand(arguments["NAMES"])
                 if arguments.cloud:
                     # "cms volume list NAMES --cloud=aws1"
-                    provider = Provider(name=arguments.cloud)
+                    provider = ProviderPool.get(name=arguments.cloud)
 
                     result = provider.list(**arguments)
                     print(provider.Print(result,
                                          kind='volume',
-                                         output=arguments.output))
+                                         output=arguments.output,
+                                         max_age=arguments.max_age))
                 else:
-                    # if "cms volume list NAMES"
-                    config = Config()
-                    clouds = list(config["cloudmesh.volume"].keys())
-                    for cloud in clouds:
-                        if len(names) != 0:
-                            banner(f"listing volume info from {cloud}")
-                        else:
-                            banner("End of listing Volumes")
-                            break
-                        active = config[f"cloudmesh.volume.{cloud}.cm.active"]
-                        if active:
-                            provider = Provider(name=cloud)
-                            listed = []
-                            for name in names:
-                                volume = provider.search(name=name)
-                                if volume:
-                                    arguments.NAME = name
-                                    result = provider.list(**arguments)
-                                    print(provider.Print(result,
-                                                         kind='volume',
-                                                         output=arguments.output
-                                                         ))
-                                    listed.append(name)
-                            if len(listed) > 0:
-                                # delete all listed volumes in names
-                                for name in listed:
-                                    names.remove(name)
+                    # "cms volume list NAMES [--parallel=N]"
+                    # every active cloud is listed once, with --parallel
+                    # the clouds are listed concurrently and printed as
+                    # they arrive
+                    index = VolumeIndex(parallel=arguments.parallel or 1,
+                                        timeout=arguments.timeout,
+                                        max_age=arguments.max_age)
+                    for cloud, volumes, error in index.scan():
+                        if error is not None:
+                            Console.error(f"listing volumes from {cloud} "
+                                          f"failed: {error}")
+                            continue
+                        found = [volume for volume in volumes
+                                 if volume["cm"]["name"] in names]
+                        if len(found) == 0:
+                            continue
+                        banner(f"listing volume info from {cloud}")
+                        index.provider(cloud).Print(found,
+                                                    kind='volume',
+                                                    output=arguments.output,
+                                                    max_age=arguments.max_age)
+                        # a volume is only listed from the first cloud
+                        # it is found in
+                        for volume in found:
+                            if volume["cm"]["name"] in names:
+                                names.remove(volume["cm"]["name"])
+                    for cloud in index.timed_out:
+                        Console.warning(f"{cloud} did not answer within "
+                                        f"{arguments.timeout} seconds")
 
             else:
                 if arguments.cloud:
                     # "cms volume list --cloud=aws1"
-                    provider = Provider(name=arguments.cloud)
-
-                    result = provider.list(**arguments)
-                    print(provider.Print(result,
-                                         kind='volume',
-                                         output=arguments.output))
+                    provider = ProviderPool.get(name=arguments.cloud)
+                    list_volumes(provider)
                 else:
                     # "cms volume list"
                     arguments['cloud'] = cloud
-                    provider = Provider(name=arguments.cloud)
-
-                    result = provider.list(**arguments)
-                    print(provider.Print(result,
-                                         kind='volume',
-                                         output=arguments.output))
+                    provider = ProviderPool.get(name=arguments.cloud)
+                    list_volumes(provider)
 
             return ""
 
@@ -243,8 +358,13 @@ class VolumeCommand(PluginCommand):
                 arguments['cloud'] = cloud
             if arguments.NAME is None:
                 arguments.NAME = str(create_name())
-            provider = Provider(name=arguments.cloud)
-            result = provider.create(**arguments)
+            provider = ProviderPool.get(name=arguments.cloud)
+            names = Parameter.expand(arguments.NAME)
+            if len(names) > 1 or arguments.parallel:
+                # "cms volume create user-vol-[1-100] --parallel=16"
+                result = provider.create_many(names, **arguments)
+            else:
+                result = provider.create(**arguments)
             print(provider.Print(result, kind='volume', output=arguments.output
                                  ))
 
@@ -254,26 +374,23 @@ class VolumeCommand(PluginCommand):
             if names is None:
                 Console.error("No volume specified or found")
                 return ""
-            config = Config()
-            clouds = list(config["cloudmesh.volume"].keys())
-            for cloud in clouds:
-                # if len(names) != 0:
-                #     banner(f"Deleting volumes from {cloud}")
-                # else:
-                #     banner("End of Deleting Volumes")
-                active = config[f"cloudmesh.volume.{cloud}.cm.active"]
-                if active:
-                    provider = Provider(name=cloud)
-                    deleted = []
-                    for name in names:
-                        volume = provider.search(name=name)
-                        if volume:
-                            result = provider.delete(name=name)
-                            deleted.append(name)
-                    if len(deleted) > 0:
-                        # delete all deleted volumes in names
-                        for name in deleted:
-                            names.remove(name)
+            index = VolumeIndex().build()
+            groups, missing = index.group(names)
+            if arguments.parallel:
+                operations = [(cloud, "delete_many", {"names": cloud_names})
+                              for cloud, cloud_names in groups.items()]
+                results = AsyncProvider.run(operations,
+                                            parallel=arguments.parallel)
+                for cloud, result, error in results:
+                    if error is not None:
+                        Console.error(f"could not delete volumes from "
+                                      f"{cloud}: {error}")
+            else:
+                for cloud, cloud_names in groups.items():
+                    provider = index.provider(cloud)
+                    result = provider.delete_many(cloud_names)
+            for name in missing:
+                Console.error(f"volume {name} not found")
 
         elif arguments.attach:
             arguments.cloud = arguments.cloud or cloud
@@ -287,75 +404,96 @@ class VolumeCommand(PluginCommand):
                 return ""
             names = Parameter.expand(names)
             # banner(f"Attaching {names} to {arguments.vm}")
-            provider = Provider(name=arguments.cloud)
-            result = provider.attach(names, vm)
+            provider = ProviderPool.get(name=arguments.cloud)
+            result = provider.attach(names, vm, dryrun=arguments.dryrun)
             print(provider.Print(result, kind='volume', output=arguments.output)
                   )
 
         elif arguments.detach:
-            config = Config()
-            clouds = list(config["cloudmesh.volume"].keys())
             volumes = arguments.NAMES or variables["volume"]
             if volumes is None:
                 Console.error("No volume specified or found")
                 return ""
             volumes = Parameter.expand(volumes)
-            for cloud in clouds:
-                # if len(volumes) != 0:
-                #     banner(f"Detaching volumes from {cloud}")
-                # else:
-                #     banner("End of Detaching Volumes")
-                #     break
-                active = config[f"cloudmesh.volume.{cloud}.cm.active"]
-                if active:
-                    detached = []
-                    provider = Provider(name=cloud)
-                    for name in volumes:
-                        # returns volume name if found in the cloud,
-                        # None if it is not in the cloud
-                        volume = provider.search(name=name)
-                        if volume:
-                            # banner(f"Detaching {name} from {cloud}")
-                            result = provider.detach(name=name)
-                            detached.append(name)
-                            print(provider.Print(result, kind='volume',
-                                                 output=arguments.output))
-                    if len(detached) > 0:
-                        # delete all detached volumes in volumes
-                        for name in detached:
-                            volumes.remove(name)
+            index = VolumeIndex().build()
+            groups, missing = index.group(volumes)
+            if arguments.parallel and not arguments.dryrun:
+                # one detach_many per cloud, so that a provider plans the
+                # detaches of a vm together, e.g. in a single stop and start
+                operations = [(cloud, "detach_many", {"names": cloud_names})
+                              for cloud, cloud_names in groups.items()]
+                results = AsyncProvider.run(operations,
+                                            parallel=arguments.parallel)
+                for cloud, result, error in results:
+                    if error is not None:
+                        Console.error(f"could not detach volumes from "
+                                      f"{cloud}: {error}")
+                    else:
+                        index.provider(cloud).Print(result, kind='volume',
+                                                    output=arguments.output)
+            else:
+                for cloud, cloud_names in groups.items():
+                    provider = index.provider(cloud)
+                    result = provider.detach_many(cloud_names,
+                                                  dryrun=arguments.dryrun)
+                    provider.Print(result, kind='volume',
+                                   output=arguments.output)
+            for name in missing:
+                Console.error(f"volume {name} not found")
 
         elif arguments.add_tag:
             arguments.cloud = arguments.cloud or cloud
-            name = arguments.NAME or variables["volume"] or get_last_volume()
-            arguments.NAME = name
-            provider = Provider(name=arguments.cloud)
-            result = provider.add_tag(**arguments)
+            if arguments.NAMES:
+                names = Parameter.expand(arguments.NAMES)
+            else:
+                names = [variables["volume"] or get_last_volume()]
+            provider = ProviderPool.get(name=arguments.cloud)
+            if len(names) == 1:
+                arguments.NAME = names[0]
+                result = provider.add_tag(**arguments)
+            else:
+                result = provider.add_tag_many(names,
+                                               key=arguments.key,
+                                               value=arguments.value)
             print(provider.Print(result, kind='volume', output=arguments.output)
                   )
 
         elif arguments.status:
             arguments.cloud = arguments.cloud or cloud
-            name = arguments.NAME or variables["volume"] or get_last_volume()
-            arguments.NAME = name
-            provider = Provider(name=arguments.cloud)
-            result = provider.status(name=name)
+            if arguments.NAMES:
+                names = Parameter.expand(arguments.NAMES)
+            else:
+                names = [variables["volume"] or get_last_volume()]
+            provider = ProviderPool.get(name=arguments.cloud)
+            if len(names) == 1:
+                arguments.NAME = names[0]
+                result = provider.status(name=names[0])
+            else:
+                result = provider.status_many(names)
             print(provider.Print(result, kind='volume', output=arguments.output)
                   )
 
         elif arguments.migrate:
             if arguments.cloud:
-                # "cms volume migrate NAME --vm=VM --cloud=aws1"
+                # "cms volume migrate NAMES --vm=VM --cloud=aws1"
                 # if no given volume, get the current volume
                 # or get the last volume,
-                name = arguments.NAME or variables["volume"] \
-                       or get_last_volume()
-                arguments.NAME = name
-                provider = Provider(name=arguments.cloud)
-                result = provider.migrate(**arguments)
-                print(provider.Print(result,
-                                     kind='volume',
-                                     output=arguments.output))
+                if arguments.NAMES:
+                    names = Parameter.expand(arguments.NAMES)
+                else:
+                    names = [variables["volume"] or get_last_volume()]
+                provider = ProviderPool.get(name=arguments.cloud)
+                if len(names) == 1:
+                    arguments.NAME = names[0]
+                    result = provider.migrate(**arguments)
+                else:
+                    result = provider.migrate_many(names,
+                                                   vm=arguments.vm,
+                                                   parallel=arguments.parallel,
+                                                   dryrun=arguments.dryrun)
+                provider.Print(result,
+                               kind='volume',
+                               output=arguments.output)
             else:
                 raise NotImplementedError
 
@@ -366,17 +504,18 @@ class VolumeCommand(PluginCommand):
             # what it actually does is copy second volume and overwrite
             # the other (current volume or first volume in NAMES)
 
-            if len([arguments.NAMES]) == 1:
+            volumes = Parameter.expand(arguments.NAMES) if arguments.NAMES \
+                else []
+            if len(volumes) == 1:
                 volumes = [variables["volume"] or get_last_volume(),
-                           arguments.NAMES]
-                arguments.NAMES = volumes
-            elif len([arguments.NAMES]) == 2:
-                volumes = arguments.NAMES
-            else:
+                           volumes[0]]
+            elif len(volumes) != 2:
                 Console.error("Two volumes should be specified")
+                return ""
+            arguments.NAMES = volumes
             # if arguments.cloud:
             arguments.cloud = cloud
-            provider = Provider(name=arguments.cloud)
+            provider = ProviderPool.get(name=arguments.cloud)
             result = provider.sync(**arguments)
             print(provider.Print(result,
                                  kind='volume',
@@ -386,7 +525,7 @@ class VolumeCommand(PluginCommand):
 
         elif arguments.purge:
             arguments.cloud = arguments.cloud or cloud
-            provider = Provider(name=arguments.cloud)
+            provider = ProviderPool.get(name=arguments.cloud)
             provider.purge(**arguments)
             result = provider.list()
             print(provider.Print(result, kind='volume', output=arguments.output)
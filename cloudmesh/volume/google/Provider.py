@@ -1,11 +1,19 @@
+import threading
+from time import monotonic
+
+import httplib2
+from cloudmesh.common.console import Console
 from cloudmesh.common.util import banner
 from cloudmesh.configuration.Config import Config
 from cloudmesh.volume.VolumeABC import VolumeABC
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from time import sleep
 from googleapiclient.errors import HttpError
 from cloudmesh.mongo.CmDatabase import CmDatabase
+from cloudmesh.volume.FanOut import FanOut
+from cloudmesh.volume.NameCache import NameCache
+from cloudmesh.volume.Waiter import Waiter
 
 
 class Provider(VolumeABC):
@@ -60,6 +68,24 @@ class Provider(VolumeABC):
         }
     }
 
+    # requests per BatchHttpRequest, the limit of the compute API
+    batch_size = 1000
+
+    # zone operations that are waited for concurrently
+    parallel = 16
+
+    # operations that only show their plan with dryrun=True
+    dryrun_operations = ['attach', 'detach', 'migrate']
+
+    # seconds an operation is expected to take, used to estimate the
+    # downtime of a plan as long as no wait of the operation was recorded
+    durations = {
+        'stop': 30,
+        'start': 20,
+        'detach': 5,
+        'attach': 5
+    }
+
     def __init__(self, name):
         """
         Get Google Cloud credentials and defaults from cloudmesh.yaml and set
@@ -77,14 +103,167 @@ class Provider(VolumeABC):
             'https://www.googleapis.com/auth/compute',
             'https://www.googleapis.com/auth/cloud-platform',
             'https://www.googleapis.com/auth/compute.readonly']
+        # the credentials and the client are built once, the token is
+        # refreshed by AuthorizedHttp when it expires. Every thread sends its
+        # requests with its own http object because httplib2 connections
+        # can not be shared between threads
+        self._service_account_credentials = None
+        self._compute_service = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # disk name -> zone, selfLink and labelFingerprint, filled by every
+        # listing and kept between invocations if cache_ttl is set
+        self.disks = NameCache(f"{name}-disk",
+                               ttl=self.default.get('cache_ttl'))
+
+    def _wait(self, operation, name=None, timeout=360):
+        """
+        Wait for a zone operation returned by a mutating call. A
+        zoneOperations().wait returns as soon as the operation is done or
+        after about two minutes, so the disk or instance is not polled.
+        The wait is added to the Waiter metrics. If the operation failed a
+        ValueError with the errors of the operation is raised.
+
+        :param operation: dict of the operation
+        :param name: name of the operation for the wait metrics, by default
+                     the operationType
+        :param timeout: seconds to wait
+        :return: dict of the finished operation
+        """
+        compute_service = self._get_compute_service()
+        http = self._thread_http()
+        name = name or operation.get('operationType')
+        zone = operation['zone'].rsplit('/', 1)[1]
+        start = monotonic()
+        polls = 0
+        timed_out = False
+        while operation['status'] != 'DONE':
+            if monotonic() - start >= timeout:
+                timed_out = True
+                Console.warning(f"{name} did not finish within {timeout} "
+                                f"seconds")
+                break
+            operation = compute_service.zoneOperations().wait(
+                project=self.credentials['project_id'],
+                zone=zone,
+                operation=operation['name']).execute(http=http)
+            polls += 1
+        Waiter.add(name, monotonic() - start, polls=polls,
+                   timed_out=timed_out)
+        if 'error' in operation:
+            errors = [error.get('message', error.get('code'))
+                      for error in operation['error'].get('errors', [])]
+            target = operation.get('targetLink', '').rsplit('/', 1)[-1]
+            raise ValueError(f"{name} of {target} failed: "
+                             f"{'; '.join(errors)}")
+        return operation
+
+    def _wait_many(self, operations, name=None, timeout=360):
+        """
+        Wait for many zone operations concurrently, with at most
+        self.parallel waits in flight
+
+        :param operations: dict of key -> operation
+        :param name: name of the operations for the wait metrics
+        :param timeout: seconds to wait for a single operation
+        :return: dict of key -> (operation, exception or None)
+        """
+        def wait(key):
+            return self._wait(operations[key], name=name, timeout=timeout)
+
+        results = {}
+        for key, operation, error in FanOut(parallel=self.parallel).run(
+                wait, operations):
+            results[key] = (operation, error)
+        return results
+
+    def _find_disk(self, zone, disk):
+        """
+        Get the specified persistent disk, None if it does not exist
+
+        :param zone: name of the zone in which the disk is located
+        :param disk: name of the disk
+        :return: a dict representing the disk or None
+        """
+        try:
+            return self._get_disk(zone, disk)
+        except HttpError:
+            return None
+
+    def _lookup(self, name):
+        """
+        Get a disk by name with a single disks().get in the zone known from
+        the disk index, or in the default zone if the disk is not indexed.
+        If the disk is not found there, the disks of all zones are listed.
+
+        :param name: name of the disk
+        :return: dict representing the disk or None if it does not exist
+        """
+        entry = self.disks.get(name)
+        zone = entry['zone'] if entry else self.default['zone']
+        disk = self._find_disk(zone, name)
+        if disk is not None:
+            return self.update_dict(disk)[0]
+        self.disks.invalidate(name)
+        for disk in self.list():
+            if disk['name'] == name:
+                return disk
+        return None
 
-    def _wait(self, time=None):
+    def _batch(self, requests):
         """
-        This function waiting for volume to be updated
+        Execute requests of the compute API in batches of at most
+        self.batch_size requests, each batch is a single http request.
 
-        :param time: time to wait in seconds
+        :param requests: dict of key -> HttpRequest, the keys are strings
+        :return: dict of key -> (response, HttpError or None)
         """
-        sleep(time)
+        compute_service = self._get_compute_service()
+        http = self._thread_http()
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        keys = list(requests)
+        for i in range(0, len(keys), self.batch_size):
+            batch = compute_service.new_batch_http_request(callback=callback)
+            for key in keys[i:i + self.batch_size]:
+                batch.add(requests[key], request_id=key)
+            batch.execute(http=http)
+        return results
+
+    def _get_disks(self, names, zone=None):
+        """
+        Get many disks with one batch of disks().get requests. The zone of
+        a disk is taken from the disk index, or is the given zone or the
+        default zone. Disks that are not found there are looked up in the
+        disks of all zones.
+
+        :param names: names of the disks
+        :param zone: zone of the disks that are not indexed
+        :return: dict of name -> dict representing the disk, disks that do
+                 not exist are missing
+        """
+        compute_service = self._get_compute_service()
+        requests = {}
+        for name in names:
+            entry = self.disks.get(name)
+            requests[name] = compute_service.disks().get(
+                project=self.credentials["project_id"],
+                zone=entry['zone'] if entry else zone or self.default['zone'],
+                disk=name)
+        found = {}
+        for name, (disk, error) in self._batch(requests).items():
+            if error is None:
+                found[name] = self.update_dict(disk)[0]
+        missing = [name for name in names if name not in found]
+        if missing:
+            self.disks.invalidate(missing)
+            for disk in self.list():
+                if disk['name'] in missing:
+                    found[disk['name']] = disk
+        return found
 
     def update_dict(self, elements):
         """
@@ -134,6 +313,14 @@ class Provider(VolumeABC):
                 "name": name,
                 "status": entry['status']
             })
+            if entry['status'] == 'deleted':
+                self.disks.invalidate(name)
+            elif 'selfLink' in entry:
+                self.disks.put(name, {
+                    'zone': entry['zone'],
+                    'selfLink': entry['selfLink'],
+                    'labelFingerprint': entry.get('labelFingerprint')
+                })
             d.append(entry)
         return d
 
@@ -154,20 +341,48 @@ class Provider(VolumeABC):
         """
         Method to get google compute service v1.
 
+        The service is built once per provider with the discovery document
+        that comes with the client library, so no discovery request is made.
+        Its requests are executed with the http object of the calling
+        thread, see _thread_http.
+
         :return: Google Compute Engine API
         """
-        service_account_credentials = self._get_credentials(
-            self.credentials['path_to_service_account_json'],
-            self.compute_scopes)
-        # Authenticate using service account.
-        if service_account_credentials is None:
-            print('Credentials are required')
-            raise ValueError('Cannot Authenticate without Credentials')
-        else:
-            compute_service = build('compute', 'v1',
-                                    credentials=service_account_credentials)
+        if self._compute_service is None:
+            http = self._thread_http()
+            with self._lock:
+                if self._compute_service is None:
+                    self._compute_service = build('compute', 'v1',
+                                                  http=http,
+                                                  cache_discovery=False)
+        return self._compute_service
+
+    def _thread_http(self):
+        """
+        Get the authorized http object of the calling thread. It keeps the
+        connection to the API open and refreshes the OAuth token only when
+        it has expired. The credentials are loaded once per provider.
 
-        return compute_service
+        :return: AuthorizedHttp
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            if self._service_account_credentials is None:
+                with self._lock:
+                    if self._service_account_credentials is None:
+                        self._service_account_credentials = \
+                            self._get_credentials(
+                                self.credentials[
+                                    'path_to_service_account_json'],
+                                self.compute_scopes)
+            # Authenticate using service account.
+            if self._service_account_credentials is None:
+                print('Credentials are required')
+                raise ValueError('Cannot Authenticate without Credentials')
+            http = AuthorizedHttp(self._service_account_credentials,
+                                  http=httplib2.Http())
+            self._local.http = http
+        return http
 
     def _get_disk(self, zone, disk):
         """
@@ -178,10 +393,11 @@ class Provider(VolumeABC):
         :return: a dict representing the disk
         """
         compute_service = self._get_compute_service()
+        http = self._thread_http()
         disk = compute_service.disks().get(
             project=self.credentials["project_id"],
             zone=zone,
-            disk=disk).execute()
+            disk=disk).execute(http=http)
         return disk
 
     def _list_instances(self, instance=None):
@@ -191,9 +407,10 @@ class Provider(VolumeABC):
         :return: list of dicts representing VM instances
         """
         compute_service = self._get_compute_service()
+        http = self._thread_http()
         instance_list = compute_service.instances().aggregatedList(
             project=self.credentials["project_id"],
-            orderBy='creationTimestamp desc').execute()
+            orderBy='creationTimestamp desc').execute(http=http)
         found_instances = []
         items = instance_list["items"]
         for item in items:
@@ -217,6 +434,7 @@ class Provider(VolumeABC):
         :return: an array of dicts representing the disks
         """
         compute_service = self._get_compute_service()
+        http = self._thread_http()
         if kwargs and kwargs['refresh'] is False:
             result = self.cm.find(cloud=self.cloud, kind='volume')
             for key in kwargs:
@@ -230,7 +448,7 @@ class Provider(VolumeABC):
                 disk_list = compute_service.disks().list(
                     project=self.credentials['project_id'],
                     zone=kwargs['region'],
-                    orderBy='creationTimestamp desc').execute()
+                    orderBy='creationTimestamp desc').execute(http=http)
                 if 'items' in disk_list:
                     disks = disk_list['items']
                     for disk in disks:
@@ -241,7 +459,7 @@ class Provider(VolumeABC):
             if kwargs['NAMES'] is not None or kwargs['vm'] is not None:
                 disk_list = compute_service.disks().aggregatedList(
                     project=self.credentials["project_id"],
-                    orderBy='creationTimestamp desc').execute()
+                    orderBy='creationTimestamp desc').execute(http=http)
 
                 if kwargs['NAMES'] is not None:
                     items = disk_list["items"]
@@ -284,7 +502,7 @@ class Provider(VolumeABC):
                 disk_list = compute_service.disks().list(
                     project=self.credentials['project_id'],
                     zone=kwargs['region'],
-                    orderBy='creationTimestamp desc').execute()
+                    orderBy='creationTimestamp desc').execute(http=http)
                 if 'items' in disk_list:
                     disks = disk_list['items']
                     for disk in disks:
@@ -293,7 +511,7 @@ class Provider(VolumeABC):
             elif kwargs['NAMES'] is not None or kwargs['vm'] is not None:
                 disk_list = compute_service.disks().aggregatedList(
                     project=self.credentials["project_id"],
-                    orderBy='creationTimestamp desc').execute()
+                    orderBy='creationTimestamp desc').execute(http=http)
 
                 if kwargs['NAMES'] is not None:
                     items = disk_list["items"]
@@ -319,7 +537,7 @@ class Provider(VolumeABC):
             else:
                 disk_list = compute_service.disks().aggregatedList(
                     project=self.credentials["project_id"],
-                    orderBy='creationTimestamp desc').execute()
+                    orderBy='creationTimestamp desc').execute(http=http)
                 items = disk_list["items"]
                 for item in items:
                     if "disks" in items[item]:
@@ -334,7 +552,7 @@ class Provider(VolumeABC):
         else:
             disk_list = compute_service.disks().aggregatedList(
                 project=self.credentials["project_id"],
-                orderBy='creationTimestamp desc').execute()
+                orderBy='creationTimestamp desc').execute(http=http)
 
             found = []
             items = disk_list["items"]
@@ -355,6 +573,7 @@ class Provider(VolumeABC):
         :return: a list containing the newly created disk
         """
         compute_service = self._get_compute_service()
+        http = self._thread_http()
         volume_type = kwargs['volume_type']
         size = kwargs['size']
         description = kwargs['description']
@@ -365,19 +584,16 @@ class Provider(VolumeABC):
             size = self.default["sizeGb"]
         if zone is None:
             zone = self.default['zone']
-        compute_service.disks().insert(
+        operation = compute_service.disks().insert(
             project=self.credentials["project_id"],
-            zone=self.default['zone'],
+            zone=zone,
             body={'type': volume_type,
                   'name': kwargs['NAME'],
                   'sizeGb': str(size),
-                  'description': description}).execute()
-        new_disk = self._get_disk(self.default['zone'], kwargs['NAME'])
-
+                  'description': description}).execute(http=http)
         # wait for disk to finish being created
-        while new_disk['status'] != 'READY':
-            self._wait(1)
-            new_disk = self._get_disk(zone, kwargs['NAME'])
+        self._wait(operation, 'create')
+        new_disk = self._get_disk(zone, kwargs['NAME'])
 
         update_new_disk = self.update_dict(new_disk)
         return update_new_disk
@@ -390,32 +606,61 @@ class Provider(VolumeABC):
         :param name: Name of the disk to delete
         """
         compute_service = self._get_compute_service()
-        disk_list = self.list()
-        zone = None
-        for disk in disk_list:  # find disk in list and get zone
-            if disk['name'] == name:
-                zone = str(disk['zone'])
-        if zone is None:
+        http = self._thread_http()
+        disk = self._lookup(name)
+        if disk is None:
             banner(f'{name} was not found')
             return
-        compute_service.disks().delete(
+        zone = str(disk['zone'])
+        operation = compute_service.disks().delete(
             project=self.credentials["project_id"],
             zone=zone,
-            disk=name).execute()
+            disk=name).execute(http=http)
 
-        # attempt to call disk from cloud
-        try:
-            deleted_disk = self._get_disk(zone, name)
-            # wait for disk to be deleted if found in cloud
-            if deleted_disk['status'] == 'DELETING':
-                while deleted_disk['status'] == 'DELETING':
-                    self._wait(1)
-                    try:
-                        deleted_disk = self._get_disk(zone, name)
-                    except HttpError:
-                        pass
-        except HttpError:
-            pass
+        # wait for disk to be deleted if found in cloud
+        self._wait(operation, 'delete')
+        self.disks.invalidate(name)
+
+    def delete_many(self, names, timeout=360):
+        """
+        Deletes many persistent disks. The disks are read and deleted with
+        one batch request each, then the delete operations are waited for
+        concurrently. Disks whose deletion failed are reported.
+
+        :param names: names of the disks to delete
+        :param timeout: seconds to wait for the deletion
+        :return: list of dicts of the disks with status "deleted"
+        """
+        compute_service = self._get_compute_service()
+        disks = self._get_disks(names)
+        for name in names:
+            if name not in disks:
+                banner(f'{name} was not found')
+
+        requests = {}
+        for name, disk in disks.items():
+            requests[name] = compute_service.disks().delete(
+                project=self.credentials["project_id"],
+                zone=disk['zone'],
+                disk=name)
+        operations = {}
+        for name, (operation, error) in self._batch(requests).items():
+            if error is not None:
+                Console.error(f"{name} could not be deleted: {error}")
+            else:
+                operations[name] = operation
+
+        deleted = []
+        for name, (operation, error) in self._wait_many(
+                operations, 'delete_many', timeout=timeout).items():
+            if error is not None:
+                Console.error(f"{name} could not be deleted: {error}")
+            elif operation['status'] == 'DONE':
+                disks[name]['status'] = 'deleted'
+                deleted.append(name)
+        self.disks.invalidate(deleted)
+        Console.msg(f"{len(deleted)} of {len(disks)} disks deleted")
+        return self.update_dict(list(disks.values()))
 
     def _get_instance(self, zone, instance):
         """
@@ -426,10 +671,11 @@ class Provider(VolumeABC):
         :return: a dict representing the instance
         """
         compute_service = self._get_compute_service()
+        http = self._thread_http()
         vm = compute_service.instances().get(
             project=self.credentials["project_id"],
             zone=zone,
-            instance=instance).execute()
+            instance=instance).execute(http=http)
         return vm
 
     def _stop_instance(self, name=None, zone=None):
@@ -440,16 +686,14 @@ class Provider(VolumeABC):
         :zone: zone in which the instance is located
         """
         compute_service = self._get_compute_service()
-        compute_service.instances().stop(
+        http = self._thread_http()
+        operation = compute_service.instances().stop(
             project=self.credentials['project_id'],
             zone=zone,
-            instance=name).execute()
+            instance=name).execute(http=http)
 
-        vm = self._get_instance(zone, name)
         # Wait for the instance to stop
-        while vm['status'] != 'TERMINATED':
-            self._wait(1)
-            vm = self._get_instance(zone, name)
+        self._wait(operation, 'stop')
 
     def _start_instance(self, name=None, zone=None):
         """
@@ -459,76 +703,220 @@ class Provider(VolumeABC):
         :zone: zone in which the instance is located
         """
         compute_service = self._get_compute_service()
-        compute_service.instances().start(
+        http = self._thread_http()
+        operation = compute_service.instances().start(
             project=self.credentials['project_id'],
             zone=zone,
-            instance=name).execute()
+            instance=name).execute(http=http)
 
-        vm = self._get_instance(zone, name)
         # Wait for the instance to start
-        while vm['status'] != 'RUNNING':
-            self._wait(1)
-            vm = self._get_instance(zone, name)
+        self._wait(operation, 'start')
 
-    def attach(self, names, vm=None):
+    def _duration(self, operation):
+        """
+        Seconds an operation is expected to take, the mean of its last
+        recorded waits or self.durations if none was recorded
+
+        :param operation: stop, start, attach or detach
+        :return: float
+        """
+        elapsed = Waiter.durations(operation)
+        if elapsed:
+            return sum(elapsed) / len(elapsed)
+        return float(self.durations[operation])
+
+    def plan(self, attach=None, detach=None):
+        """
+        Group the disk changes per instance. GCP requires that an instance
+        is stopped while disks are attached or detached, with the plan every
+        instance is stopped and started at most once for all its changes.
+        A disk that is detached from and attached to the same instance is
+        left as it is.
+
+        :param attach: dict of instance name -> names of disks to attach
+        :param detach: names of disks to detach from all their instances
+        :return: dict of instance name -> dict with the zone and status of
+                 the instance and the disk names to attach and to detach
+        """
+        instances = {}
+        for instance in self._list_instances():
+            instances[instance['name']] = instance
+        plan = {}
+
+        def changes(vm):
+            if vm not in plan:
+                if vm not in instances:
+                    raise ValueError(f"vm {vm} was not found")
+                plan[vm] = {
+                    'zone': instances[vm]['zone'].rsplit('/', 1)[1],
+                    'status': instances[vm]['status'],
+                    'attach': [],
+                    'detach': []
+                }
+            return plan[vm]
+
+        detach = detach or []
+        disks = self._get_disks(detach) if detach else {}
+        for name in detach:
+            if name not in disks:
+                Console.error(f"{name} was not found")
+                continue
+            for user in disks[name].get('users', []):
+                changes(user)['detach'].append(name)
+        for vm, names in (attach or {}).items():
+            entry = changes(vm)
+            for name in names:
+                if name in entry['detach']:
+                    entry['detach'].remove(name)
+                else:
+                    entry['attach'].append(name)
+        return plan
+
+    def estimate(self, plan):
+        """
+        Estimate the restarts and the downtime of a plan. The instances
+        are changed concurrently, so the downtime of the plan is the one of
+        the slowest instance.
+
+        :param plan: the plan returned by self.plan
+        :return: list of dicts with vm, attach, detach, restart and downtime
+                 in seconds
+        """
+        result = []
+        for vm, entry in plan.items():
+            restart = entry['status'] == 'RUNNING' and \
+                      bool(entry['attach'] or entry['detach'])
+            downtime = 0.0
+            if restart:
+                downtime = self._duration('stop') + self._duration('start')
+                if entry['detach']:
+                    downtime += self._duration('detach')
+                if entry['attach']:
+                    downtime += self._duration('attach')
+            result.append({'vm': vm,
+                           'attach': entry['attach'],
+                           'detach': entry['detach'],
+                           'restart': restart,
+                           'downtime': round(downtime, 1)})
+        return result
+
+    def execute(self, plan, dryrun=False):
+        """
+        Execute a plan in a single stop/start window per instance: all
+        running instances with changes are stopped, then all disks are
+        detached, then all disks are attached and at last the instances are
+        started again. Each step runs concurrently over all instances and
+        disks. With dryrun only the estimate of the plan is printed.
+
+        :param plan: the plan returned by self.plan
+        :param dryrun: if True nothing is changed
+        :return: names of the disks that were attached or detached
+        """
+        estimate = self.estimate(plan)
+        restarts = [entry['vm'] for entry in estimate if entry['restart']]
+        if dryrun:
+            for entry in estimate:
+                Console.msg(f"{entry['vm']}: attach {len(entry['attach'])}, "
+                            f"detach {len(entry['detach'])}, "
+                            f"restart {entry['restart']}, "
+                            f"downtime {entry['downtime']} seconds")
+            downtime = max([entry['downtime'] for entry in estimate] or [0])
+            Console.msg(f"{len(restarts)} VM restarts, estimated downtime "
+                        f"{downtime} seconds")
+            return []
+
+        compute_service = self._get_compute_service()
+        fanout = FanOut(parallel=self.parallel)
+        stopped = []
+        for vm, result, error in fanout.run(
+                lambda vm: self._stop_instance(vm, plan[vm]['zone']),
+                restarts):
+            if error is not None:
+                Console.error(f"VM {vm} could not be stopped: {error}")
+            else:
+                stopped.append(vm)
+        # the disks of instances that are still running are not changed
+        ready = [vm for vm in plan if vm in stopped or vm not in restarts]
+        changed = []
+        try:
+            requests = {}
+            for vm in ready:
+                for name in plan[vm]['detach']:
+                    banner(f"Detaching {name} from {vm}")
+                    requests[f"{vm}/{name}"] = \
+                        compute_service.instances().detachDisk(
+                            project=self.credentials['project_id'],
+                            zone=plan[vm]['zone'],
+                            instance=vm,
+                            deviceName=name)
+            changed += self._run(requests, 'detach')
+
+            names = [name for vm in ready for name in plan[vm]['attach']]
+            disks = self._get_disks(names)
+            requests = {}
+            for vm in ready:
+                for name in plan[vm]['attach']:
+                    if name not in disks:
+                        Console.error(f"{name} was not found")
+                        continue
+                    banner(f"Attaching {name} to {vm}")
+                    requests[f"{vm}/{name}"] = \
+                        compute_service.instances().attachDisk(
+                            project=self.credentials['project_id'],
+                            zone=plan[vm]['zone'],
+                            instance=vm,
+                            body={'source': disks[name]['selfLink'],
+                                  'deviceName': name})
+            changed += self._run(requests, 'attach')
+        finally:
+            for vm, result, error in fanout.run(
+                    lambda vm: self._start_instance(vm, plan[vm]['zone']),
+                    stopped):
+                if error is not None:
+                    Console.error(f"VM {vm} could not be started: {error}")
+        return changed
+
+    def _run(self, requests, name):
+        """
+        Send the requests in one batch and wait for their operations
+
+        :param requests: dict of "vm/disk" -> HttpRequest
+        :param name: name of the operations for the wait metrics
+        :return: names of the disks whose operation succeeded
+        """
+        operations = {}
+        for key, (operation, error) in self._batch(requests).items():
+            if error is not None:
+                Console.error(f"{name} {key} failed: {error}")
+            else:
+                operations[key] = operation
+        done = []
+        for key, (operation, error) in self._wait_many(
+                operations, name).items():
+            if error is not None:
+                Console.error(f"{name} {key} failed: {error}")
+            else:
+                done.append(key.split('/', 1)[1])
+        return done
+
+    def attach(self, names, vm=None, dryrun=False):
         """
         Attach one or more disks to an instance.  GCP requires that the
         instance be stopped when attaching a disk.  If the instance is running
         when the attach function is called, the function will stop the instance
-        and then restart the instance after attaching the disk.
+        and then restart the instance after attaching all disks.
 
         :param names: name(s) of disk(s) to attach
         :param vm: instance name which the volume(s) will be attached to
+        :param dryrun: if True only the planned restarts are shown
         :return: updated disks with current status
         """
-        compute_service = self._get_compute_service()
-        instance_list = self._list_instances()
-        zone_url = None
-        instance_status = None
-        for instance in instance_list:
-            if instance['name'] == vm:
-                zone_url = instance['zone']
-                instance_status = instance['status']
-        zone = zone_url.rsplit('/', 1)[1]
-
-        # Stop the instance if necessary
-        if instance_status == 'RUNNING':
-            banner(f"Stopping VM {vm}")
-            self._stop_instance(vm, zone)
-
-        # get URL source to disk(s) from list of disks
-        disk_list = self.list()
-        for name in names:
-            source = None
-            for disk in disk_list:
-                if disk['name'] == name:
-                    source = disk['selfLink']
-            banner(f"Attaching {name}")
-            compute_service.instances().attachDisk(
-                project=self.credentials['project_id'],
-                zone=zone,
-                instance=vm,
-                body={'source': source,
-                      'deviceName': name}).execute()
-        new_attached_disks = []
-        for name in names:
-            get_disk = self._get_disk(zone, name)
-            # wait for disk to finish attaching
-            while 'users' not in get_disk:
-                self._wait(1)
-                get_disk = self._get_disk(zone, name)
-            new_attached_disks.append(get_disk)
-        # update newly attached disks
-        result = self.update_dict(new_attached_disks)
-
-        # Restart the instance if previously running
-        if instance_status == 'RUNNING':
-            banner(f"Restarting VM {vm}")
-            self._start_instance(vm, zone)
+        plan = self.plan(attach={vm: names})
+        attached = self.execute(plan, dryrun=dryrun)
+        disks = self._get_disks(attached)
+        return [disks[name] for name in names if name in disks]
 
-        return result
-
-    def detach(self, name=None):
+    def detach(self, name=None, dryrun=False):
         """
         Detach a disk from all instances.  GCP requires that the
         instance be stopped when detaching a disk.  If the instance is running
@@ -536,52 +924,26 @@ class Provider(VolumeABC):
         and then restart the instance after detaching the disk.
 
         :param name: name of disk to detach
+        :param dryrun: if True only the planned restarts are shown
         :return: dict representing updated status of detached disk
         """
-        compute_service = self._get_compute_service()
-        instances = []
-        zone = None
-        disk_list = self.list()
-        for disk in disk_list:
-            if disk['name'] == name:
-                zone = disk['zone']
-                for user in disk['users']:
-                    instances.append(user)
-
-        # detach disk from all instances
-        result = None
-        for instance in instances:
-            vm = self._get_instance(zone, instance)
-            instance_status = vm['status']
-
-            # Stop the instance if necessary
-            if instance_status == 'RUNNING':
-                banner(f"Stopping VM {instance}")
-                self._stop_instance(instance, zone)
-
-            banner(f"Detaching {name}")
-            compute_service.instances().detachDisk(
-                project=self.credentials['project_id'],
-                zone=zone,
-                instance=instance,
-                deviceName=name).execute()
-
-            # Wait for disk to detach
-            detached_disk = self._get_disk(zone, name)
-            if 'users' in detached_disk:
-                while instance in detached_disk['users']:
-                    self._wait(1)
-                    detached_disk = self._get_disk(zone, name)
-
-            # Restart the instance if necessary
-            if instance_status == 'RUNNING':
-                banner(f"Restarting VM {instance}")
-                self._start_instance(instance, zone)
+        result = self.detach_many([name], dryrun=dryrun)
+        return result[0] if result else None
 
-            # update newly detached disk
-            result = self.update_dict(detached_disk)
+    def detach_many(self, names, dryrun=False):
+        """
+        Detach disks from all their instances. Every instance is stopped and
+        restarted at most once for all of its disks.
 
-        return result[0]
+        :param names: names of the disks to detach
+        :param dryrun: if True only the planned restarts are shown
+        :return: list of dicts representing the detached disks
+        """
+        plan = self.plan(detach=names)
+        self.execute(plan, dryrun=dryrun)
+        if dryrun:
+            return []
+        return self.status_many(names)
 
     def add_tag(self, **kwargs):
         """
@@ -592,27 +954,25 @@ class Provider(VolumeABC):
         :return: updated list of disks with new label
         """
         compute_service = self._get_compute_service()
-        disk_list = self.list()
-        # find disk in list and get zone
+        http = self._thread_http()
+        # find disk and get zone
         zone = None
         label_fingerprint = None
-        for disk in disk_list:
-            if disk['name'] == kwargs['NAME']:
-                zone = str(disk['zone'])
-                label_fingerprint = disk['labelFingerprint']
-        compute_service.disks().setLabels(
+        disk = self._lookup(kwargs['NAME'])
+        if disk is not None:
+            zone = str(disk['zone'])
+            label_fingerprint = disk['labelFingerprint']
+        body = {'labelFingerprint': label_fingerprint,
+                'labels': {kwargs['key']: str(kwargs['value'])}}
+        operation = compute_service.disks().setLabels(
             project=self.credentials['project_id'],
             zone=zone,
             resource=kwargs['NAME'],
-            body={'labelFingerprint': label_fingerprint,
-                  'labels': {kwargs['key']: str(kwargs['value'])}}).execute()
-
-        tagged_disk = self._get_disk(self.default['zone'], kwargs['NAME'])
+            body=body).execute(http=http)
 
         # wait for tag to be applied
-        while 'labels' not in tagged_disk:
-            self._wait(1)
-            tagged_disk = self._get_disk(self.default['zone'], kwargs['NAME'])
+        self._wait(operation, 'add_tag')
+        tagged_disk = self._get_disk(zone, kwargs['NAME'])
 
         updated_disk = self.update_dict(tagged_disk)
         return updated_disk[0]
@@ -624,34 +984,92 @@ class Provider(VolumeABC):
         :param name: name of disk
         :return: list containing dict representing the disk
         """
-        disk_list = self.list()
-        vol = []
-        for disk in disk_list:
-            if disk['name'] == name:
-                vol.append(disk)
-                break
-        result = self.update_dict(vol)
-        return result
+        disk = self._lookup(name)
+        if disk is None:
+            return []
+        return [disk]
 
-    def migrate(self,
-                name=None,
-                from_vm=None,
-                to_vm=None):
+    def status_many(self, names):
+        """
+        Get the status of many disks with one batch request
 
+        :param names: names of the disks
+        :return: list of dicts representing the disks
         """
-        Migrate volume from one vm to another vm.
+        disks = self._get_disks(names)
+        return [disks[name] for name in names if name in disks]
 
-        :param name: name of volume
-        :param from_vm: name of vm where volume will be moved from
-        :param to_vm: name of vm where volume will be moved to
+    def add_tag_many(self, names, key=None, value=None):
+        """
+        Add a key:value label to many disks. The disks are read and labeled
+        with one batch request each, then the label operations are waited
+        for concurrently.
+
+        :param names: names of the disks
+        :param key: key of the label
+        :param value: value of the label
+        :return: list of dicts representing the updated disks
+        """
+        compute_service = self._get_compute_service()
+        disks = self._get_disks(names)
+        for name in names:
+            if name not in disks:
+                Console.error(f"{name} was not found")
+        requests = {}
+        for name, disk in disks.items():
+            requests[name] = compute_service.disks().setLabels(
+                project=self.credentials['project_id'],
+                zone=disk['zone'],
+                resource=name,
+                body={'labelFingerprint': disk['labelFingerprint'],
+                      'labels': {key: str(value)}})
+        operations = {}
+        for name, (operation, error) in self._batch(requests).items():
+            if error is not None:
+                Console.error(f"{name} could not be labeled: {error}")
+            else:
+                operations[name] = operation
+        labeled = []
+        for name, (operation, error) in self._wait_many(
+                operations, 'add_tag').items():
+            if error is not None:
+                Console.error(f"{name} could not be labeled: {error}")
+            else:
+                labeled.append(name)
+        tagged = self._get_disks(labeled)
+        return [tagged[name] for name in names if name in tagged]
+
+    def migrate(self, **kwargs):
+        """
+        Migrate a disk from its instances to another instance, the disk and
+        the instances have to be in the same zone.
+
+        :param NAME: name of the disk
+        :param vm: name of the instance the disk is moved to
+        :param dryrun: if True only the planned restarts are shown
         :return: dict of disk with updated info
         """
-        self.detach(name)
-        self.attach(name, vm=to_vm)
-        result = self.status(name)
-        # this only would work when disk and instances are all in the same zone
-        # include how to migrate disks between zones and regions
-        raise NotImplementedError
+        result = self.migrate_many([kwargs['NAME']],
+                                   kwargs['vm'],
+                                   dryrun=kwargs.get('dryrun'))
+        return result[0] if result else []
+
+    def migrate_many(self, names, vm, parallel=None, dryrun=False):
+        """
+        Migrate disks from their instances to another instance in one plan,
+        so every instance involved is stopped and started at most once.
+
+        :param names: names of the disks
+        :param vm: name of the instance the disks are moved to
+        :param parallel: not used, the plan is executed concurrently
+        :param dryrun: if True only the planned restarts are shown
+        :return: list of dicts of the disks with updated info
+        """
+        plan = self.plan(attach={vm: names}, detach=names)
+        self.execute(plan, dryrun=dryrun)
+        if dryrun:
+            return []
+        return self.status_many(names)
 
     def sync(self,
              from_volume=None,
@@ -28,6 +28,7 @@ def readfile(filename):
 
 requiers = """
 psutil
+importlib_metadata; python_version < "3.8"
 """.splitlines()
 
 requiers_cloudmesh = """
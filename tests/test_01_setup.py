@@ -8,7 +8,6 @@
 import pytest
 import json
 import os
-from time import sleep
 from cloudmesh.common.Benchmark import Benchmark
 from cloudmesh.common.Shell import Shell
 from cloudmesh.common.debug import VERBOSE
@@ -16,6 +15,7 @@ from cloudmesh.common.util import HEADING
 from cloudmesh.common.variables import Variables
 from cloudmesh.configuration.Config import Config
 from cloudmesh.volume.Provider import Provider
+from cloudmesh.volume.Waiter import Waiter
 
 from cloudmesh.management.configuration.name import Name
 
@@ -63,17 +63,15 @@ class Test_provider_volume:
             Benchmark.Start()
             result = os.system(cmd)
             Benchmark.Stop()
-            status = None
-            start_timeout = 360
-            time = 0
-            while time <= start_timeout:
-                sleep(10)
-                time += 10
+
+            def vm_status():
                 response = Shell.run(f"multipass info {name} --format=json")
                 response = json.loads(response)
-                status = response["info"][name]['state']
-                if status == "Running":
-                    break
+                return response["info"][name]['state']
+
+            waiter = Waiter("test_vm", timeout=360, delay=5)
+            status = waiter.wait(vm_status,
+                                 done=lambda state: state == "Running")
             assert status == 'Running'
         else:
             cmd = "cms vm boot --name=" + name
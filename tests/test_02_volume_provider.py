@@ -5,7 +5,6 @@
 # TODO: assertuons need to be added
 
 import os
-from time import sleep
 
 import pytest
 from cloudmesh.common.Benchmark import Benchmark
@@ -14,6 +13,7 @@ from cloudmesh.common.util import HEADING
 from cloudmesh.common.variables import Variables
 from cloudmesh.configuration.Config import Config
 from cloudmesh.volume.Provider import Provider
+from cloudmesh.volume.Waiter import Waiter
 
 from cloudmesh.management.configuration.name import Name
 
@@ -41,6 +41,24 @@ name = str(name_generator)
 provider = Provider(name=cloud)
 
 
+def get_status(volume_name):
+    """
+    get the status of a volume independent of the cloud
+
+    :param volume_name: name of the volume
+    :return: string
+    """
+    data = provider.status(name=volume_name)[0]
+    if cloud == "oracle":
+        return data['lifecycle_state']
+    elif cloud == "openstack" or cloud == "google":
+        return data['status']
+    elif cloud == "aws" or cloud == "multipass":
+        return data['State']
+    elif cloud == "azure":
+        return data["disk_state"]
+
+
 @pytest.mark.incremental
 class Test_provider_volume:
 
@@ -61,14 +79,10 @@ class Test_provider_volume:
             for v in data:
                 status = v['lifecycle_state']
         elif cloud == "aws" or cloud == "multipass":
-            start_timeout = 360
-            time = 0
-            while time <= start_timeout:
-                sleep(15)
-                time += 15
-                status = provider.status(name=name)[0]['State']
-                if status == "available":
-                    break
+            waiter = Waiter("test_create", timeout=360)
+            status = waiter.wait(
+                lambda: provider.status(name=name)[0]['State'],
+                done=lambda state: state == "available")
         elif cloud == "azure":
             status = provider.status(name=name)[0]['disk_state']
         assert status in ['available', 'AVAILABLE', 'PROVISIONING', 'READY',
@@ -91,24 +105,12 @@ class Test_provider_volume:
         names.append(name)
         provider.attach(names=names, vm=variables.__getitem__("vm_name"))
         Benchmark.Stop()
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            if cloud == "oracle":
-                status = provider.status(name=names[0])[0]['lifecycle_state']
-            if cloud == "openstack":
-                status = provider.status(name=names[0])[0]['status']
-            elif cloud == "aws" or cloud == "multipass":
-                status = provider.status(name=name)[0]['State']
-            elif cloud == "azure":
-                status = provider.status(name=name)[0]["disk_state"]
-            elif cloud == "google":
-                status = provider.status(name=name)[0]['status']
-            # In case of Oracle, status is AVAILABLE after attach
-            if status in ['in-use', 'AVAILABLE', 'READY', "Attached"]:
-                break
+        waiter = Waiter("test_attach", timeout=360)
+        # In case of Oracle, status is AVAILABLE after attach
+        status = waiter.wait(
+            lambda: get_status(names[0]),
+            done=lambda state: state in ['in-use', 'AVAILABLE', 'READY',
+                                         "Attached"])
         assert status in ['in-use', 'AVAILABLE', 'READY', "Attached"]
 
     def test_provider_volume_detach(self):
@@ -118,23 +120,11 @@ class Test_provider_volume:
         Benchmark.Start()
         provider.detach(name=name)
         Benchmark.Stop()
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            if cloud == "oracle":
-                status = provider.status(name=name)[0]['lifecycle_state']
-            if cloud == "openstack":
-                status = provider.status(name=name)[0]['status']
-            elif cloud == "aws" or cloud == "multipass":
-                status = provider.status(name=name)[0]['State']
-            elif cloud == "azure":
-                status = provider.status(name=name)[0]["disk_state"]
-            elif cloud == "google":
-                status = provider.status(name=name)[0]['status']
-            if status in ['available', 'AVAILABLE', 'READY', "Unattached"]:
-                break
+        waiter = Waiter("test_detach", timeout=360)
+        status = waiter.wait(
+            lambda: get_status(name),
+            done=lambda state: state in ['available', 'AVAILABLE', 'READY',
+                                         "Unattached"])
         assert status in ['available', 'AVAILABLE', 'READY', "Unattached"]
 
     def test_provider_volume_delete(self):
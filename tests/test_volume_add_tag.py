@@ -3,7 +3,6 @@
 ###############################################################
 
 import os
-from time import sleep
 
 import pytest
 from cloudmesh.common.Benchmark import Benchmark
@@ -12,6 +11,7 @@ from cloudmesh.common.util import HEADING
 from cloudmesh.common.variables import Variables
 from cloudmesh.configuration.Config import Config
 from cloudmesh.volume.Provider import Provider
+from cloudmesh.volume.Waiter import Waiter
 
 from cloudmesh.management.configuration.name import Name
 
@@ -58,14 +58,10 @@ class Test_provider_volume:
             for v in data:
                 status = v['lifecycle_state']
         elif cloud == "aws" or cloud == "multipass":
-            start_timeout = 360
-            time = 0
-            while time <= start_timeout:
-                sleep(15)
-                time += 15
-                status = provider.status(name=name)[0]['State']
-                if status == "available":
-                    break
+            waiter = Waiter("test_create", timeout=360)
+            status = waiter.wait(
+                lambda: provider.status(name=name)[0]['State'],
+                done=lambda state: state == "available")
         elif cloud == "azure":
             status = provider.status(name=name)[0]['disk_state']
         assert status in ['available', 'AVAILABLE', 'PROVISIONING', 'READY',
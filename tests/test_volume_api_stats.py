@@ -0,0 +1,73 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_api_stats.py
+###############################################################
+
+import json
+
+import pytest
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.ApiStats import ApiStats
+
+
+class ServiceModel(object):
+    service_name = "ec2"
+
+
+class OperationModel(object):
+    name = "DescribeVolumes"
+    service_model = ServiceModel()
+
+
+def call(parsed, throttled=0):
+    """
+    Emit the botocore events of one API call
+    """
+    context = {}
+    ApiStats._before(context=context)
+    for i in range(throttled):
+        ApiStats._retry(
+            response=(None, {"Error": {"Code": "RequestLimitExceeded"}}),
+            request_dict={"context": context})
+    ApiStats._after(model=OperationModel(), parsed=parsed, context=context)
+
+
+@pytest.mark.incremental
+class Test_api_stats:
+
+    def test_calls(self):
+        HEADING()
+        ApiStats.clear()
+        call({"ResponseMetadata": {"RetryAttempts": 0}})
+        call({"ResponseMetadata": {"RetryAttempts": 2}}, throttled=2)
+        stats = ApiStats.stats()
+        assert len(stats) == 1
+        assert stats[0]["operation"] == "DescribeVolumes"
+        assert stats[0]["calls"] == 2
+        assert stats[0]["retries"] == 2
+        assert stats[0]["throttled"] == 2
+        assert stats[0]["errors"] == 0
+
+    def test_throttled_error(self):
+        HEADING()
+        ApiStats.clear()
+        # the retries are used up, the last attempt is throttled, too
+        call({"Error": {"Code": "RequestLimitExceeded"},
+              "ResponseMetadata": {"RetryAttempts": 4}}, throttled=5)
+        stats = ApiStats.stats()
+        assert stats[0]["throttled"] == 5
+        assert stats[0]["errors"] == 1
+
+    def test_errors(self):
+        HEADING()
+        ApiStats.clear()
+        call({"Error": {"Code": "InvalidVolume.NotFound"}})
+        assert ApiStats.stats()[0]["errors"] == 1
+
+    def test_export(self, tmp_path):
+        HEADING()
+        path = str(tmp_path / "stats.json")
+        ApiStats.export(path, waits=[])
+        with open(path) as f:
+            data = json.load(f)
+        assert data["api"][0]["calls"] == 1
+        assert data["waits"] == []
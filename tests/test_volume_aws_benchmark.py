@@ -0,0 +1,307 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_aws_benchmark.py
+# CLOUDMESH_VOLUME_BENCHMARK_SIZES=10,1000,10000 \
+#     pytest -v --capture=no tests/test_volume_aws_benchmark.py
+###############################################################
+#
+# Benchmarks of the aws provider against moto, a local stand-in for EC2.
+# No credentials or cloudmesh.yaml are needed. By default moto runs in
+# process, if CLOUDMESH_VOLUME_EC2_ENDPOINT is set (e.g.
+# http://localhost:5000) a moto server at that address is used instead.
+# Every benchmark records the number of EC2 API calls in extra_info.
+#
+
+import contextlib
+import os
+import urllib.request
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+pytest.importorskip("pytest_benchmark")
+
+import cloudmesh.volume.aws.Provider as aws
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.WriteBehind import WriteBehind
+
+sizes = [int(size) for size in
+         os.environ.get("CLOUDMESH_VOLUME_BENCHMARK_SIZES", "10").split(",")]
+endpoint = os.environ.get("CLOUDMESH_VOLUME_EC2_ENDPOINT")
+
+region_name = "us-east-1"
+zone = "us-east-1a"
+other_zone = "us-east-1b"
+
+
+class Config(dict):
+    """
+    The parts of cloudmesh.yaml the aws provider reads
+    """
+
+    def __init__(self):
+        super().__init__()
+        self["cloudmesh.volume.aws.default"] = {
+            "volume_type": "gp2",
+            "size": 1,
+            "encrypted": False,
+            "region_name": region_name,
+            "region": zone,
+            "snapshot": "None",
+            "waiter_delay": 1,
+            "waiter_max_attempts": 60,
+            "endpoint_url": endpoint
+        }
+        self["cloudmesh.volume.aws.credentials"] = {
+            "EC2_ACCESS_ID": "testing",
+            "EC2_SECRET_KEY": "testing"
+        }
+
+
+class Database(object):
+    """
+    Records written by the provider, instead of MongoDB
+    """
+
+    def __init__(self):
+        self.records = {}
+
+    def write(self, data):
+        # upsert by kind, cloud and name like WriteBehind.write
+        for entry in WriteBehind._records(data):
+            cm = entry["cm"]
+            self.records[(cm["kind"], cm["cloud"], cm["name"])] = entry
+        return {}
+
+    def find(self, collection=None, query=None, **kwargs):
+        return [record for record in self.records.values()
+                if all(record["cm"].get(key[3:]) == value
+                       for key, value in (query or {}).items())]
+
+
+class Ebs(object):
+    """
+    The EBS direct API is not part of moto. Volumes do not change between
+    two syncs, unless a snapshot is listed in changed: then blocks changed
+    since that snapshot.
+    """
+
+    def __init__(self, changed=()):
+        self.changed = set(changed)
+
+    def list_changed_blocks(self, **kwargs):
+        if kwargs["FirstSnapshotId"] in self.changed:
+            return {"ChangedBlocks": [{"BlockIndex": 0}]}
+        return {"ChangedBlocks": []}
+
+
+def stand_in():
+    """
+    The moto context: a fresh in process mock, or a reset of the moto server
+    """
+    if endpoint is None:
+        mock = getattr(moto, "mock_aws", None) or getattr(moto, "mock_ec2")
+        return mock()
+    urllib.request.urlopen(urllib.request.Request(
+        f"{endpoint}/moto-api/reset", method="POST"))
+    return contextlib.nullcontext()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    with stand_in():
+        database = Database()
+        monkeypatch.setattr(aws, "Config", Config)
+        monkeypatch.setattr(aws, "CmDatabase", lambda: database)
+        monkeypatch.setattr(WriteBehind, "write", database.write)
+        provider = aws.Provider(name="aws")
+        provider.ebs = Ebs()
+        provider.calls = 0
+
+        def count(**kwargs):
+            provider.calls += 1
+
+        provider.client.meta.events.register("before-call.ec2", count)
+        yield provider
+
+
+def names(size):
+    return [f"bench-{i}" for i in range(size)]
+
+
+def create_volumes(provider, size, region=zone):
+    for name in names(size):
+        provider.client.create_volume(
+            AvailabilityZone=region,
+            Size=1,
+            VolumeType="gp2",
+            TagSpecifications=[{
+                "ResourceType": "volume",
+                "Tags": [{"Key": "Name", "Value": name}]
+            }])
+    return names(size)
+
+
+def create_vm(provider, name="bench-vm"):
+    image = provider.client.describe_images()["Images"][0]["ImageId"]
+    provider.client.run_instances(
+        ImageId=image,
+        MinCount=1,
+        MaxCount=1,
+        Placement={"AvailabilityZone": zone},
+        TagSpecifications=[{
+            "ResourceType": "instance",
+            "Tags": [{"Key": "Name", "Value": name}]
+        }])
+    return name
+
+
+def run(benchmark, provider, function):
+    """
+    Time function once and record the number of API calls it made
+    """
+    provider.calls = 0
+    result = benchmark.pedantic(function, rounds=1, iterations=1)
+    benchmark.extra_info["api_calls"] = provider.calls
+    return result
+
+
+def attachable(size):
+    # one instance has only so many device names
+    return min(size, len(aws.Provider.devices))
+
+
+@pytest.mark.parametrize("size", sizes)
+class Test_aws_benchmark:
+
+    def test_list(self, benchmark, provider, size):
+        HEADING()
+        create_volumes(provider, size)
+        result = run(benchmark, provider,
+                     lambda: provider.list(refresh=True))
+        assert len(result) == size
+
+    def test_create(self, benchmark, provider, size):
+        HEADING()
+
+        def create():
+            for name in names(size):
+                provider.create(NAME=name)
+
+        run(benchmark, provider, create)
+        assert len(provider.list(refresh=True)) == size
+
+    def test_attach(self, benchmark, provider, size):
+        HEADING()
+        volumes = create_volumes(provider, attachable(size))
+        vm = create_vm(provider)
+        result = run(benchmark, provider,
+                     lambda: provider.attach(volumes, vm))
+        assert all(entry["State"] == "in-use" for entry in result)
+
+    def test_detach(self, benchmark, provider, size):
+        HEADING()
+        volumes = create_volumes(provider, attachable(size))
+        vm = create_vm(provider)
+        provider.attach(volumes, vm)
+
+        def detach():
+            for name in volumes:
+                provider.detach(name)
+
+        run(benchmark, provider, detach)
+        # the root volume of the vm stays attached
+        result = provider.list(NAMES=volumes, refresh=True)
+        assert len(result) == len(volumes)
+        assert all(entry["State"] == "available" for entry in result)
+
+    def test_delete(self, benchmark, provider, size):
+        HEADING()
+        volumes = create_volumes(provider, size)
+        result = run(benchmark, provider,
+                     lambda: provider.delete_many(volumes))
+        assert len(result) == size
+
+    def test_migrate(self, benchmark, provider, size):
+        HEADING()
+        volumes = create_volumes(provider, attachable(size),
+                                 region=other_zone)
+        vm = create_vm(provider)
+        run(benchmark, provider,
+            lambda: provider.migrate_many(volumes, vm))
+        assert "create" in provider.timings
+        result = provider.list(NAMES=volumes, refresh=True)
+        assert len(result) == len(volumes)
+        for entry in result:
+            assert entry["AvailabilityZone"] == zone
+            assert entry["State"] == "in-use"
+            assert entry["AttachedToVm"] == [vm]
+
+    def test_sync(self, benchmark, provider, size):
+        HEADING()
+        volumes = create_volumes(provider, 2)
+        provider.sync(NAMES=volumes)
+
+        def sync():
+            for i in range(size):
+                provider.sync(NAMES=volumes)
+
+        run(benchmark, provider, sync)
+
+
+class Test_aws_list:
+
+    def test_renamed_vm(self, provider):
+        HEADING()
+        volumes = create_volumes(provider, 1)
+        vm = create_vm(provider)
+        provider.attach(volumes, vm)
+        result = provider.list(NAMES=volumes, refresh=True)
+        assert result[0]["AttachedToVm"] == [vm]
+        provider.client.create_tags(
+            Resources=[provider.find_vm_id(vm)],
+            Tags=[{"Key": "Name", "Value": "renamed"}])
+        result = provider.list(NAMES=volumes, refresh=True)
+        assert result[0]["AttachedToVm"] == ["renamed"]
+
+
+class Test_aws_sync:
+
+    def test_unchanged(self, provider):
+        HEADING()
+        volumes = create_volumes(provider, 2)
+        provider.sync(NAMES=volumes)
+        target = provider.find_volume_id(volumes[0])
+        provider.sync(NAMES=volumes)
+        assert provider.find_volume_id(volumes[0]) == target
+
+    def test_target_written(self, provider):
+        HEADING()
+        volumes = create_volumes(provider, 2)
+        provider.sync(NAMES=volumes)
+        target = provider.find_volume_id(volumes[0])
+        # the source is unchanged, but the target was written to
+        lineage = provider.lineage(volumes[0])
+        provider.ebs = Ebs(changed=[lineage["target_snapshot_id"]])
+        provider.sync(NAMES=volumes)
+        assert provider.find_volume_id(volumes[0]) != target
+
+
+class Test_aws_delete_many:
+
+    def test_straggler(self, provider):
+        HEADING()
+        volumes = create_volumes(provider, 3)
+        straggler = provider.find_volume_id(volumes[0])
+        delete_volume = provider.client.delete_volume
+
+        def delete_all_but_one(VolumeId=None, **kwargs):
+            # the first volume is never deleted
+            if VolumeId != straggler:
+                return delete_volume(VolumeId=VolumeId, **kwargs)
+
+        provider.client.delete_volume = delete_all_but_one
+        result = provider.delete_many(volumes, timeout=2, interval=1)
+        states = {entry["VolumeId"]: entry["State"] for entry in result}
+        assert states.pop(straggler) == "available"
+        assert list(states.values()) == ["deleted", "deleted"]
@@ -0,0 +1,131 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_aws_devices.py
+###############################################################
+#
+# Tests of the device planner of the aws provider and of attach with
+# dryrun against a fake ec2 client, no cloud or cloudmesh.yaml is needed.
+#
+
+import threading
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import cloudmesh.volume.aws.Provider as aws
+from botocore.exceptions import ClientError
+from cloudmesh.common.util import HEADING
+
+
+class Client(object):
+    """
+    Answers every attach_volume with DryRunOperation, as EC2 does for a
+    request with DryRun=True that would have succeeded
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def attach_volume(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs["DryRun"]:
+            raise ClientError(
+                {"Error": {"Code": "DryRunOperation",
+                           "Message": "Request would have succeeded"}},
+                "AttachVolume")
+        return {"Device": kwargs["Device"], "State": "attaching"}
+
+
+def instance(*devices, root="/dev/xvda"):
+    return {"InstanceId": "i-1",
+            "RootDeviceName": root,
+            "BlockDeviceMappings": [{"DeviceName": device}
+                                    for device in (root,) + devices]}
+
+
+@pytest.fixture
+def provider():
+    provider = aws.Provider.__new__(aws.Provider)
+    provider.cloud = "aws"
+    provider.client = Client()
+    provider._device_lock = threading.Lock()
+    provider._reserved_devices = {}
+    return provider
+
+
+class Test_aws_devices:
+
+    def test_slot(self):
+        HEADING()
+        slot = aws.Provider._slot
+        assert slot("/dev/sdf") == slot("/dev/xvdf") == "f"
+        assert slot("/dev/xvdba") == "ba"
+        assert slot("/dev/sda1") == slot("/dev/xvda") == "a"
+
+    def test_plan_skips_used_devices(self, provider):
+        HEADING()
+        # xvdf is sdf, so both sdf and sdg are taken
+        plan = provider.plan_devices(
+            "i-1", ["a", "b"], instance=instance("/dev/xvdf", "/dev/sdg"))
+        assert plan == {"a": "/dev/sdh", "b": "/dev/sdi"}
+
+    def test_plan_skips_root_device(self, provider):
+        HEADING()
+        plan = provider.plan_devices(
+            "i-1", ["a"], instance={"RootDeviceName": "/dev/sdf"})
+        assert plan == {"a": "/dev/sdg"}
+
+    def test_plan_reserves_devices(self, provider):
+        HEADING()
+        first = provider.plan_devices("i-1", ["a", "b"], instance=instance())
+        second = provider.plan_devices("i-1", ["c"], instance=instance())
+        assert second["c"] not in first.values()
+        # another vm has its own devices
+        other = provider.plan_devices("i-2", ["d"], instance=instance())
+        assert other["d"] == first["a"]
+        provider.release_devices("i-1", first.values())
+        third = provider.plan_devices("i-1", ["e"], instance=instance())
+        assert third["e"] == first["a"]
+
+    def test_plan_concurrent(self, provider):
+        HEADING()
+        plans = []
+
+        def plan(name):
+            plans.append(provider.plan_devices("i-1", [name],
+                                               instance=instance()))
+
+        threads = [threading.Thread(target=plan, args=(f"v{i}",))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        devices = [device for entry in plans for device in entry.values()]
+        assert len(devices) == 20
+        assert len({aws.Provider._slot(device) for device in devices}) == 20
+
+    def test_plan_no_device_left(self, provider):
+        HEADING()
+        names = [f"v{i}" for i in range(len(provider.devices) + 1)]
+        plan = provider.plan_devices("i-1", names, instance={})
+        assert len(plan) == len(provider.devices)
+        assert names[-1] not in plan
+
+    def test_attach_dryrun(self, provider):
+        HEADING()
+        attached = provider._attach_volumes(
+            "vm", "i-1", {"a": "vol-1", "b": "vol-2"}, dryrun=True,
+            instance=instance())
+        # DryRunOperation is a success, but nothing is attaching
+        assert attached == []
+        assert len(provider.client.calls) == 2
+        assert all(call["DryRun"] for call in provider.client.calls)
+        # the planned devices are released again
+        assert provider._reserved_devices["i-1"] == set()
+
+    def test_attach(self, provider):
+        HEADING()
+        attached = provider._attach_volumes(
+            "vm", "i-1", {"a": "vol-1", "b": "vol-2"}, instance=instance())
+        assert sorted(attached) == ["vol-1", "vol-2"]
@@ -0,0 +1,73 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_cached_list.py
+###############################################################
+#
+# Tests of the records that list --max_age returns from the database,
+# against a fake database, no cloud or cloudmesh.yaml is needed.
+#
+
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+import cloudmesh.volume.Provider as facade
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.WriteBehind import WriteBehind
+
+
+def record(name, age, state="available"):
+    modified = datetime.utcnow() - timedelta(seconds=age)
+    return {"cm": {"name": name,
+                   "cloud": "aws",
+                   "kind": "volume",
+                   "modified": modified.isoformat()},
+            "State": state}
+
+
+class Database(object):
+
+    records = []
+
+    def find(self, **kwargs):
+        return list(self.records)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(facade, "CmDatabase", Database)
+    monkeypatch.setattr(WriteBehind, "flush", lambda: {})
+    Database.records = [record("fresh", 10),
+                        record("stale", 1000),
+                        record("gone", 10, state="deleted")]
+    provider = facade.Provider.__new__(facade.Provider)
+    provider.cloud = "aws"
+    return provider
+
+
+class Test_cached_list:
+
+    def test_all_stale(self, provider):
+        HEADING()
+        assert provider._cached(60) is None
+
+    def test_names_fresh(self, provider):
+        HEADING()
+        # the stale record of another volume does not matter
+        records = provider._cached(60, NAMES=["fresh"])
+        assert [entry["cm"]["name"] for entry in records] == ["fresh"]
+        records = provider._cached(60, NAME="fresh")
+        assert [entry["cm"]["name"] for entry in records] == ["fresh"]
+
+    def test_names_stale(self, provider):
+        HEADING()
+        assert provider._cached(60, NAMES=["fresh", "stale"]) is None
+
+    def test_name_without_record(self, provider):
+        HEADING()
+        assert provider._cached(60, NAMES=["fresh", "new"]) is None
+        assert provider._cached(60, NAME="gone") is None
+
+    def test_vm(self, provider):
+        HEADING()
+        assert provider._cached(6000, vm="vm") is None
@@ -0,0 +1,72 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_cold_start.py
+###############################################################
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from cloudmesh.common.Benchmark import Benchmark
+from cloudmesh.common.util import HEADING
+
+Benchmark.debug()
+
+# seconds a fresh interpreter may take to load the volume command and the
+# multipass provider. The time depends on the machine, so it is only
+# checked if a budget is set, e.g. CLOUDMESH_VOLUME_COLD_START=2.0
+budget = os.environ.get("CLOUDMESH_VOLUME_COLD_START")
+
+sdks = [
+    "boto3",
+    "botocore",
+    "googleapiclient",
+    "google.oauth2",
+    "azure",
+    "oci",
+    "openstack",
+]
+
+script = """
+import json
+import sys
+import time
+
+start = time.time()
+from cloudmesh.volume.command.volume import VolumeCommand
+from cloudmesh.volume.Provider import Provider
+Provider.get_provider("multipass")
+stop = time.time()
+sdks = {sdks}
+loaded = [sdk for sdk in sdks if sdk in sys.modules]
+print(json.dumps({{"time": stop - start, "loaded": loaded}}))
+""".format(sdks=sdks)
+
+
+def cold_start():
+    output = subprocess.check_output([sys.executable, "-c", script])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+@pytest.mark.incremental
+class Test_cold_start:
+
+    def test_multipass_loads_no_cloud_sdk(self):
+        HEADING()
+        Benchmark.Start()
+        result = cold_start()
+        Benchmark.Stop()
+        print(result)
+        assert result["loaded"] == []
+
+    @pytest.mark.skipif(budget is None,
+                        reason="CLOUDMESH_VOLUME_COLD_START is not set")
+    def test_cold_start_budget(self):
+        HEADING()
+        result = cold_start()
+        print(result)
+        assert result["time"] < float(budget)
+
+    def test_benchmark(self):
+        Benchmark.print(sysinfo=False, csv=True, tag="multipass")
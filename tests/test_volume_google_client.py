@@ -0,0 +1,106 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_google_client.py
+###############################################################
+#
+# cms set cloud=google
+#
+# Compares the first call of _get_compute_service, which loads the
+# credentials and builds the client, with the calls that reuse it, and a
+# disk listing on a new connection with one on the reused connection.
+#
+
+import threading
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from cloudmesh.common.Benchmark import Benchmark
+from cloudmesh.common.StopWatch import StopWatch
+from cloudmesh.common.util import HEADING
+from cloudmesh.common.variables import Variables
+from cloudmesh.volume.FanOut import FanOut
+from cloudmesh.volume.ProviderPool import ProviderPool
+from googleapiclient.discovery import build
+
+Benchmark.debug()
+
+variables = Variables()
+
+cloud = variables.parameter('cloud')
+
+print(f"Test run for {cloud}")
+
+if cloud is None:
+    raise ValueError("cloud is not not set")
+
+provider = ProviderPool.get(name=cloud).provider
+
+if provider.kind != "google":
+    pytest.skip(f"{cloud} is not a google cloud", allow_module_level=True)
+
+calls = 20
+
+
+def list_disks(compute_service):
+    compute_service.disks().list(
+        project=provider.credentials['project_id'],
+        zone=provider.default['zone']).execute()
+
+
+@pytest.mark.incremental
+class Test_google_client:
+
+    def test_build(self):
+        HEADING()
+        Benchmark.Start()
+        first = provider._get_compute_service()
+        Benchmark.Stop()
+        assert first is not None
+
+    def test_reuse(self):
+        HEADING()
+        first = provider._get_compute_service()
+        Benchmark.Start()
+        for i in range(calls):
+            assert provider._get_compute_service() is first
+        Benchmark.Stop()
+
+    def test_threads(self):
+        HEADING()
+        first = provider._get_compute_service()
+        results = [result for key, result, error in FanOut(parallel=4).run(
+            lambda key: (provider._get_compute_service(),
+                         threading.get_ident(),
+                         id(provider._thread_http())),
+            range(8))]
+        # one client, but every thread has its own connection
+        assert all(result[0] is first for result in results)
+        assert len({result[1] for result in results}) == \
+               len({result[2] for result in results})
+
+    def test_call_new_connection(self):
+        HEADING()
+        StopWatch.start("google new connection")
+        for i in range(calls):
+            # what every call cost before the client was cached
+            credentials = provider._get_credentials(
+                provider.credentials['path_to_service_account_json'],
+                provider.compute_scopes)
+            list_disks(build('compute', 'v1', credentials=credentials,
+                             cache_discovery=False))
+        StopWatch.stop("google new connection")
+        print("per call", StopWatch.get("google new connection") / calls)
+
+    def test_call_cached_client(self):
+        HEADING()
+        StopWatch.start("google cached client")
+        for i in range(calls):
+            list_disks(provider._get_compute_service())
+        StopWatch.stop("google cached client")
+        print("per call", StopWatch.get("google cached client") / calls)
+        assert StopWatch.get("google cached client") <= \
+               StopWatch.get("google new connection")
+
+    def test_benchmark(self):
+        Benchmark.print(sysinfo=False, csv=True, tag=cloud)
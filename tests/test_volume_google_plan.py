@@ -0,0 +1,173 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_google_plan.py
+###############################################################
+#
+# Tests of the stop/start planner of the google provider against a fake
+# compute service, no cloud or cloudmesh.yaml is needed.
+#
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import cloudmesh.volume.google.Provider as google
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.NameCache import NameCache
+from cloudmesh.volume.Waiter import Waiter
+
+
+class Request(object):
+
+    def __init__(self, function):
+        self.function = function
+
+    def execute(self, http=None):
+        return self.function()
+
+
+class Batch(object):
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        for request_id, request in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+class Compute(object):
+    """
+    The disks, instances and batch requests of the compute API. Changing
+    calls are recorded in self.calls.
+    """
+
+    def __init__(self, disks):
+        self.disks_ = disks
+        self.calls = []
+
+    def new_batch_http_request(self, callback=None):
+        return Batch(callback)
+
+    def disks(self):
+        return self
+
+    def instances(self):
+        return self
+
+    def get(self, project=None, zone=None, disk=None):
+        return Request(lambda: dict(self.disks_[disk]))
+
+    def detachDisk(self, **kwargs):
+        self.calls.append(("detach", kwargs["deviceName"]))
+        return Request(lambda: {})
+
+    def attachDisk(self, **kwargs):
+        self.calls.append(("attach", kwargs["body"]["deviceName"]))
+        return Request(lambda: {})
+
+    def delete(self, **kwargs):
+        self.calls.append(("delete", kwargs["disk"]))
+        return Request(lambda: {"name": f"delete-{kwargs['disk']}",
+                                "zone": f"zones/{kwargs['zone']}",
+                                "status": "DONE"})
+
+
+def disk(name, users=()):
+    return {"name": name,
+            "zone": "zones/zone-a",
+            "type": "diskTypes/pd-standard",
+            "status": "READY",
+            "selfLink": f"disks/{name}",
+            "users": [f"instances/{user}" for user in users]}
+
+
+@pytest.fixture
+def provider():
+    provider = google.Provider.__new__(google.Provider)
+    provider.cloud = "google"
+    provider.default = {"zone": "zone-a"}
+    provider.credentials = {"project_id": "project"}
+    provider.disks = NameCache("google-plan-test")
+    provider.compute = Compute({
+        "a": disk("a", users=["old"]),
+        "b": disk("b", users=["old"]),
+        "c": disk("c", users=["vm"])
+    })
+    provider._get_compute_service = lambda: provider.compute
+    provider._thread_http = lambda: None
+    provider._list_instances = lambda: [
+        {"name": "vm", "zone": "zones/zone-a", "status": "RUNNING"},
+        {"name": "old", "zone": "zones/zone-a", "status": "TERMINATED"}]
+    provider.restarts = []
+    provider._stop_instance = \
+        lambda name, zone: provider.restarts.append(("stop", name))
+    provider._start_instance = \
+        lambda name, zone: provider.restarts.append(("start", name))
+    Waiter.clear()
+    return provider
+
+
+class Test_google_plan:
+
+    def test_plan(self, provider):
+        HEADING()
+        plan = provider.plan(attach={"vm": ["a", "b", "c"]},
+                             detach=["a", "b", "c"])
+        assert plan["old"]["detach"] == ["a", "b"]
+        assert plan["old"]["attach"] == []
+        # c is already attached to vm and is left as it is
+        assert plan["vm"]["detach"] == []
+        assert plan["vm"]["attach"] == ["a", "b"]
+
+    def test_plan_unknown_vm(self, provider):
+        HEADING()
+        with pytest.raises(ValueError):
+            provider.plan(attach={"missing": ["a"]})
+
+    def test_estimate(self, provider):
+        HEADING()
+        plan = provider.plan(attach={"vm": ["a", "b"]}, detach=["a", "b"])
+        estimate = {entry["vm"]: entry for entry in provider.estimate(plan)}
+        # old is stopped already, only vm is restarted
+        assert not estimate["old"]["restart"]
+        assert estimate["old"]["downtime"] == 0
+        assert estimate["vm"]["restart"]
+        durations = provider.durations
+        assert estimate["vm"]["downtime"] == \
+               durations["stop"] + durations["start"] + durations["attach"]
+
+    def test_estimate_measured(self, provider):
+        HEADING()
+        Waiter.add("stop", 10)
+        Waiter.add("stop", 20)
+        plan = provider.plan(attach={"vm": ["a"]})
+        estimate = provider.estimate(plan)[0]
+        durations = provider.durations
+        assert estimate["downtime"] == \
+               15 + durations["start"] + durations["attach"]
+
+    def test_execute_dryrun(self, provider):
+        HEADING()
+        plan = provider.plan(attach={"vm": ["a", "b"]}, detach=["a", "b"])
+        assert provider.execute(plan, dryrun=True) == []
+        assert provider.compute.calls == []
+        assert provider.restarts == []
+
+    def test_delete_many(self, provider):
+        HEADING()
+        # the disks are read with a batch request, not with a listing
+        provider.list = lambda **kwargs: pytest.fail("list was called")
+        result = provider.delete_many(["a", "b"])
+        assert provider.compute.calls == [("delete", "a"), ("delete", "b")]
+        assert sorted(disk["name"] for disk in result) == ["a", "b"]
+        assert all(disk["status"] == "deleted" for disk in result)
+
+    def test_migrate_dryrun(self, provider):
+        HEADING()
+        assert provider.migrate_many(["a", "b"], "vm", dryrun=True) == []
+        assert provider.compute.calls == []
+        assert provider.restarts == []
@@ -5,7 +5,6 @@
 import pytest
 import json
 import os
-from time import sleep
 from cloudmesh.common.Benchmark import Benchmark
 from cloudmesh.common.Shell import Shell
 from cloudmesh.common.debug import VERBOSE
@@ -72,7 +71,6 @@ class Test_provider_volume:
         Benchmark.Start()
         data = provider.migrate(**params)
         Benchmark.Stop()
-        sleep(10)
         assert data[0]['AttachedToVm'][0] == vm_name2
 
     def test_provider_volume_sync(self):
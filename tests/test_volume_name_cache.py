@@ -0,0 +1,69 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_name_cache.py
+###############################################################
+
+import os
+from time import sleep
+
+import pytest
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.NameCache import NameCache
+
+
+@pytest.mark.incremental
+class Test_name_cache:
+
+    def test_hit_and_miss(self):
+        HEADING()
+        cache = NameCache("test-volume-id")
+        assert cache.get("vol-a") is None
+        cache.put("vol-a", "vol-0001")
+        assert cache.get("vol-a") == "vol-0001"
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_invalidate(self):
+        HEADING()
+        cache = NameCache("test-volume-id")
+        cache.put("vol-a", "vol-0001")
+        cache.put("vol-b", "vol-0002")
+        cache.invalidate("vol-a")
+        assert cache.get("vol-a") is None
+        assert cache.get("vol-b") == "vol-0002"
+        cache.invalidate()
+        assert cache.get("vol-b") is None
+
+    def test_ttl(self, tmp_path, monkeypatch):
+        HEADING()
+        monkeypatch.setattr(NameCache, "directory", str(tmp_path))
+        cache = NameCache("test-ttl", ttl=0.1)
+        cache.put("vol-a", "vol-0001")
+        assert cache.get("vol-a") == "vol-0001"
+        sleep(0.2)
+        assert cache.get("vol-a") is None
+
+    def test_persistence(self, tmp_path, monkeypatch):
+        HEADING()
+        monkeypatch.setattr(NameCache, "directory", str(tmp_path))
+        cache = NameCache("test-persist", ttl=60)
+        cache.put("vol-a", "vol-0001")
+        cache.save()
+        assert os.path.exists(cache.path)
+        cache = NameCache("test-persist", ttl=60)
+        assert cache.get("vol-a") == "vol-0001"
+
+    def test_stats(self):
+        HEADING()
+        names = [entry["name"] for entry in NameCache.stats()]
+        assert "test-volume-id" in names
+
+    def test_clear_stats(self):
+        HEADING()
+        cache = NameCache("test-clear-stats")
+        cache.put("vol-a", "vol-0001")
+        cache.get("vol-a")
+        cache.get("vol-b")
+        NameCache.clear_stats()
+        assert (cache.hits, cache.misses) == (0, 0)
+        # the entries are kept
+        assert cache.get("vol-a") == "vol-0001"
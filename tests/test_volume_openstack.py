@@ -7,12 +7,12 @@
 
 import pytest
 import os
-from time import sleep
 from cloudmesh.common.debug import VERBOSE
 from cloudmesh.common.util import HEADING
 from cloudmesh.common.variables import Variables
 from cloudmesh.common.Benchmark import Benchmark
 from cloudmesh.volume.Provider import Provider
+from cloudmesh.volume.Waiter import Waiter
 from cloudmesh.configuration.Config import Config
 from cloudmesh.management.configuration.name import Name
 
@@ -97,14 +97,10 @@ class Test_provider_volume:
         NAMES.append(name)
         provider.attach(NAMES=NAMES, vm=vm)
         Benchmark.Stop()
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            status = provider.status(NAME=NAMES[0])[0]['status']
-            if status == "in-use":
-                break
+        waiter = Waiter("test_attach", timeout=360)
+        status = waiter.wait(
+            lambda: provider.status(NAME=NAMES[0])[0]['status'],
+            done=lambda state: state == "in-use")
         assert status == "in-use"
 
     def test_provider_volume_detach(self):
@@ -114,14 +110,10 @@ class Test_provider_volume:
         Benchmark.Start()
         provider.detach(NAME=name)
         Benchmark.Stop()
-        start_timeout = 360
-        time = 0
-        while time <= start_timeout:
-            sleep(5)
-            time += 5
-            status = provider.status(NAME=name)[0]['status']
-            if status == "available":
-                break
+        waiter = Waiter("test_detach", timeout=360)
+        status = waiter.wait(
+            lambda: provider.status(NAME=name)[0]['status'],
+            done=lambda state: state == "available")
         assert status == "available"
 
     def test_provider_volume_delete(self):
@@ -0,0 +1,65 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_provider_pool.py
+###############################################################
+
+import os
+
+import pytest
+from cloudmesh.common.Benchmark import Benchmark
+from cloudmesh.common.util import HEADING
+from cloudmesh.common.util import path_expand
+from cloudmesh.common.variables import Variables
+from cloudmesh.volume.ProviderPool import ProviderPool
+
+Benchmark.debug()
+
+variables = Variables()
+
+#
+# cms set cloud=aws
+#
+cloud = variables.parameter('cloud')
+
+print(f"Test run for {cloud}")
+
+if cloud is None:
+    raise ValueError("cloud is not not set")
+
+
+@pytest.mark.incremental
+class Test_provider_pool:
+
+    def test_provider_pool_reuse(self):
+        HEADING()
+        ProviderPool.clear()
+        Benchmark.Start()
+        first = ProviderPool.get(name=cloud)
+        second = ProviderPool.get(name=cloud)
+        Benchmark.Stop()
+        assert first is second
+        stats = ProviderPool.stats()
+        assert stats["saved"] >= 1
+
+    def test_provider_pool_invalidate(self):
+        HEADING()
+        first = ProviderPool.get(name=cloud)
+        configuration = path_expand("~/.cloudmesh/cloudmesh.yaml")
+        stat = os.stat(configuration)
+        os.utime(configuration, (stat.st_atime, stat.st_mtime + 1))
+        try:
+            second = ProviderPool.get(name=cloud)
+        finally:
+            os.utime(configuration, (stat.st_atime, stat.st_mtime))
+        assert first is not second
+        assert ProviderPool.stats()["invalidated"] >= 1
+
+    def test_provider_pool_clear_stats(self):
+        HEADING()
+        first = ProviderPool.get(name=cloud)
+        ProviderPool.clear_stats()
+        assert ProviderPool.get(name=cloud) is first
+        stats = ProviderPool.stats()
+        assert (stats["built"], stats["saved"]) == (0, 1)
+
+    def test_benchmark(self):
+        Benchmark.print(sysinfo=False, csv=True, tag=cloud)
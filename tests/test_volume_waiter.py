@@ -0,0 +1,84 @@
+###############################################################
+# pytest -v --capture=no tests/test_volume_waiter.py
+###############################################################
+
+import pytest
+from cloudmesh.common.util import HEADING
+from cloudmesh.volume.Waiter import Waiter
+
+
+class Counter(object):
+
+    def __init__(self, done_after, states=None):
+        self.calls = 0
+        self.done_after = done_after
+        self.states = states or {}
+
+    def poll(self):
+        self.calls += 1
+        return self.calls
+
+    def state(self, value):
+        return self.states.get(value, "pending")
+
+
+@pytest.mark.incremental
+class Test_waiter:
+
+    def test_waiter_done(self):
+        HEADING()
+        counter = Counter(3)
+        waiter = Waiter("test_done", timeout=10, delay=0.01, jitter=0)
+        value = waiter.wait(counter.poll, done=lambda v: v >= 3)
+        assert value == 3
+        assert waiter.polls == 3
+        assert not waiter.timed_out
+
+    def test_waiter_backoff(self):
+        HEADING()
+        counter = Counter(4)
+        waiter = Waiter("test_backoff", timeout=10, delay=0.01, backoff=2,
+                        jitter=0)
+        waiter.wait(counter.poll, done=lambda v: v >= 4)
+        # 0.01 + 0.02 + 0.04
+        assert abs(waiter.waited - 0.07) < 0.001
+
+    def test_waiter_hint(self):
+        HEADING()
+        counter = Counter(2)
+        waiter = Waiter("test_hint", timeout=10, delay=0.01, jitter=0,
+                        hints={"pending": 0.2})
+        waiter.wait(counter.poll, done=lambda v: v >= 2,
+                    state=counter.state)
+        assert waiter.waited >= 0.2
+
+    def test_waiter_timeout(self):
+        HEADING()
+        counter = Counter(1000)
+        waiter = Waiter("test_timeout", timeout=0.1, delay=0.01, jitter=0)
+        waiter.wait(counter.poll, done=lambda v: False)
+        assert waiter.timed_out
+        assert waiter.waited <= 0.11
+
+    def test_waiter_stats(self):
+        HEADING()
+        stats = {entry["operation"]: entry for entry in Waiter.stats()}
+        assert stats["test_done"]["polls"] == 3
+        assert stats["test_timeout"]["timed_out"] == 1
+
+    def test_waiter_clear_stats(self):
+        HEADING()
+        Waiter.clear_stats()
+        Waiter.add("test_clear", 1.0, polls=2)
+        stats = Waiter.stats()
+        assert [entry["operation"] for entry in stats] == ["test_clear"]
+        # the waits are kept for the estimates
+        assert Waiter.durations("test_done")
+
+    def test_waiter_history(self):
+        HEADING()
+        for i in range(Waiter.history + 10):
+            Waiter.add("test_history", float(i))
+        durations = Waiter.durations("test_history")
+        assert len(durations) == Waiter.history
+        assert durations[-1] == Waiter.history + 9